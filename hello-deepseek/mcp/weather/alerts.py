@@ -0,0 +1,107 @@
+import heapq
+from typing import Any
+import httpx
+import ijson
+
+# --- 预警排序依据 ---
+# 数值越大越重要，未知或缺失的取值排在最后
+SEVERITY_RANK = {"Extreme": 4, "Severe": 3, "Moderate": 2, "Minor": 1}
+URGENCY_RANK = {"Immediate": 4, "Expected": 3, "Future": 2, "Past": 1}
+
+# 格式化和分组时实际用到的属性字段，其余字段（geometry、parameters、references 等）一律丢弃
+ALERT_FIELDS = ("event", "areaDesc", "severity", "urgency", "certainty", "sent", "description", "instruction")
+
+
+def _slim_feature(props: dict[str, Any]) -> dict[str, Any]:
+    """只保留需要的字段，UGC 地理编码用于按区域分组。"""
+    slim = {field: props[field] for field in ALERT_FIELDS if field in props}
+    slim["geocode"] = {"UGC": props.get("geocode", {}).get("UGC", [])}
+    return {"properties": slim}
+
+
+def ugc_matches(ugc_codes: list[str], code: str) -> bool:
+    """判断 UGC 地理编码是否属于给定的州/海域代码或预报区代码。"""
+    if len(code) == 2:
+        return any(ugc[:2] == code for ugc in ugc_codes)
+    return code in ugc_codes
+
+
+class _TopAlerts:
+    """用大小为 limit 的小顶堆保留最重要的预警，同时统计匹配总数。"""
+
+    def __init__(self, limit: int | None):
+        self.limit = limit
+        self.heap: list[tuple[tuple[int, int, str], int, dict[str, Any]]] = []
+        self.total = 0
+
+    def push(self, rank: tuple[int, int, str], seq: int, feature: dict[str, Any]) -> None:
+        self.total += 1
+        # seq 作为平局时的次序，避免比较字典
+        item = (rank, seq, feature)
+        if self.limit is None or len(self.heap) < self.limit:
+            heapq.heappush(self.heap, item)
+        elif rank > self.heap[0][0]:
+            heapq.heapreplace(self.heap, item)
+
+    def result(self) -> dict[str, Any]:
+        ordered = sorted(self.heap, key=lambda item: (item[0], -item[1]), reverse=True)
+        return {"features": [feature for _, _, feature in ordered], "total": self.total}
+
+
+async def parse_alert_stream(
+    response: httpx.Response,
+    severity: set[str] | None = None,
+    urgency: set[str] | None = None,
+    limit: int | None = None,
+    areas: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    以流的方式增量解析 NWS 预警 GeoJSON，边解析边筛选和取前 N 条。
+
+    只构建每条预警的 properties 对象，geometry 多边形在解析时直接跳过；
+    limit 不为空时用一个大小为 limit 的小顶堆保留最重要的预警，
+    因此无论预警源有多大，内存占用和结果大小都是有界的。
+    给出 areas 时按 UGC 地理编码分组，每个区域各自保留前 limit 条。
+
+    Returns:
+        {"features": [...], "total": 匹配筛选条件的预警总数}，features 按重要性从高到低排列；
+        给出 areas 时为 {"areas": {区域代码: {"features": [...], "total": n}}}。
+    """
+    events = ijson.sendable_list()
+    parser = ijson.items_coro(events, "features.item.properties")
+    top = _TopAlerts(limit)
+    groups = {code: _TopAlerts(limit) for code in areas} if areas else None
+    seq = 0
+
+    def consume() -> None:
+        nonlocal seq
+        for props in events:
+            if severity and props.get("severity") not in severity:
+                continue
+            if urgency and props.get("urgency") not in urgency:
+                continue
+            seq += 1
+            rank = (
+                SEVERITY_RANK.get(props.get("severity"), 0),
+                URGENCY_RANK.get(props.get("urgency"), 0),
+                props.get("sent") or "",
+            )
+            feature = _slim_feature(props)
+            if groups is None:
+                top.push(rank, seq, feature)
+                continue
+            ugc_codes = feature["properties"]["geocode"]["UGC"]
+            for code, group in groups.items():
+                if ugc_matches(ugc_codes, code):
+                    group.push(rank, seq, feature)
+        del events[:]
+
+    async for chunk in response.aiter_bytes():
+        parser.send(chunk)
+        consume()
+    parser.close()
+    consume()
+
+    if groups is not None:
+        return {"areas": {code: group.result() for code, group in groups.items()}}
+    return top.result()
@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Mapping
+
+# --- 网格点缓存配置 ---
+# 缓存文件位置，默认放在用户目录下，保证 stdio 子进程每次重启都能复用
+GRID_CACHE_PATH = os.getenv(
+    "NWS_GRID_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "weather-mcp", "gridpoints.sqlite3"),
+)
+# 缓存有效期（秒），NWS 的经纬度→网格映射几乎不变，默认 30 天
+GRID_CACHE_TTL = float(os.getenv("NWS_GRID_CACHE_TTL", str(30 * 24 * 3600)))
+# 经纬度保留的小数位数。2 位约 1.1 公里，小于 NWS 2.5 公里的网格间距，
+# 附近的查询会落到同一个缓存条目上
+GRID_CACHE_PRECISION = int(os.getenv("NWS_GRID_CACHE_PRECISION", "2"))
+
+# --- 响应缓存配置 ---
+# 内存中最多保留的响应条目数，超出后淘汰最久未使用的条目
+RESPONSE_CACHE_SIZE = int(os.getenv("NWS_RESPONSE_CACHE_SIZE", "256"))
+
+
+class GridPointCache:
+    """
+    基于 SQLite 的 /points 查询结果缓存。
+
+    以四舍五入后的经纬度为键，保存网格点信息（预报接口 URL、网格编号等），
+    跨进程、跨重启持久化。任何 SQLite 错误都按未命中处理，不影响工具调用。
+    """
+
+    def __init__(self, path: str, ttl: float, precision: int):
+        self.path = path
+        self.ttl = ttl
+        self.precision = precision
+        self._conn: sqlite3.Connection | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def round_coords(self, latitude: float, longitude: float) -> tuple[float, float]:
+        """把经纬度对齐到缓存使用的精度。"""
+        return round(latitude, self.precision), round(longitude, self.precision)
+
+    def _key(self, latitude: float, longitude: float) -> str:
+        lat, lon = self.round_coords(latitude, longitude)
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def _connect(self) -> sqlite3.Connection:
+        # 首次使用时才打开数据库，避免在导入模块时产生磁盘 I/O
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS gridpoints ("
+                " key TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, latitude: float, longitude: float) -> dict[str, Any] | None:
+        """返回未过期的网格点信息，未命中或已过期时返回 None。"""
+        try:
+            row = self._connect().execute(
+                "SELECT data, fetched_at FROM gridpoints WHERE key = ?",
+                (self._key(latitude, longitude),),
+            ).fetchone()
+        except sqlite3.Error:
+            self.misses += 1
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, latitude: float, longitude: float, data: dict[str, Any]) -> None:
+        """写入（或覆盖）一个网格点条目。"""
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO gridpoints (key, data, fetched_at) VALUES (?, ?, ?)",
+                (self._key(latitude, longitude), json.dumps(data), time.time()),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _parse_cache_control(value: str) -> dict[str, str | None]:
+    """把 Cache-Control 头解析成 {指令: 参数} 字典，指令名统一小写。"""
+    directives: dict[str, str | None] = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> float | None:
+    """
+    按 HTTP 缓存语义计算响应的剩余新鲜期（秒）。
+
+    返回 None 表示响应不允许缓存（no-store）；返回 0 表示可以缓存但每次使用前必须重新验证。
+    优先使用 Cache-Control 的 max-age，其次是 Expires 与 Date 之差，并扣除 Age。
+    """
+    directives = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+
+    lifetime = 0.0
+    if directives.get("max-age"):
+        try:
+            lifetime = float(directives["max-age"])
+        except ValueError:
+            lifetime = 0.0
+    elif headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+            date = parsedate_to_datetime(headers["date"]).timestamp() if headers.get("date") else time.time()
+            lifetime = expires - date
+        except (TypeError, ValueError):
+            # 无法解析的 Expires（例如 "0"）按已过期处理
+            lifetime = 0.0
+
+    try:
+        lifetime -= float(headers.get("age", 0))
+    except ValueError:
+        pass
+    return max(lifetime, 0.0)
+
+
+class CachedResponse:
+    """一条缓存的响应：解析后的 JSON、验证器（ETag / Last-Modified）以及过期时间。"""
+
+    __slots__ = ("data", "etag", "last_modified", "expires_at")
+
+    def __init__(self, data: Any, etag: str | None, last_modified: str | None, expires_at: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def conditional_headers(self) -> dict[str, str]:
+        """重新验证时附带的条件请求头。"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    遵循 HTTP 缓存语义的内存响应缓存（LRU）。
+
+    新鲜的条目直接在本地返回；过期但带有验证器的条目通过条件请求重新验证，
+    上游返回 304 时沿用本地数据并刷新过期时间。同时统计命中、未命中与重新验证次数。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get(self, url: str) -> CachedResponse | None:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def peek(self, url: str) -> CachedResponse | None:
+        """查看条目但不改变 LRU 顺序。"""
+        return self._entries.get(url)
+
+    def store(self, url: str, headers: Mapping[str, str], data: Any) -> None:
+        """根据响应头决定是否缓存该响应。"""
+        lifetime = freshness_lifetime(headers)
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        # 既不新鲜也无法重新验证的响应缓存了也没有意义
+        if lifetime is None or (lifetime == 0 and not etag and not last_modified):
+            self._entries.pop(url, None)
+            return
+        self._entries[url] = CachedResponse(data, etag, last_modified, time.monotonic() + lifetime)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def refresh(self, url: str, headers: Mapping[str, str]) -> CachedResponse | None:
+        """处理 304 响应：保留缓存数据，按新的响应头更新验证器和过期时间。"""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        lifetime = freshness_lifetime(headers) or 0.0
+        entry.expires_at = time.monotonic() + lifetime
+        entry.etag = headers.get("etag", entry.etag)
+        entry.last_modified = headers.get("last-modified", entry.last_modified)
+        return entry
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# 进程内共享的网格点缓存实例
+grid_cache = GridPointCache(GRID_CACHE_PATH, GRID_CACHE_TTL, GRID_CACHE_PRECISION)
+# 进程内共享的 HTTP 响应缓存实例
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+# 本地压测工具：模拟多个 MCP 客户端并发调用网络模式下的天气服务器，
+# 统计吞吐量（每秒请求数）和尾延迟。
+#
+# 用法示例：
+#   uv run weather.py --transport streamable-http --port 8000
+#   uv run loadgen.py --clients 50 --requests 20 --tool get_alerts --args '{"state": "CA"}'
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """最近秩法计算百分位数，输入必须已排序。"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_client(args: argparse.Namespace, latencies: list[float], errors: list[str]) -> None:
+    """一个客户端：建立自己的 MCP 会话，然后顺序发起若干次工具调用。"""
+    if args.transport == "sse":
+        transport = sse_client(args.url)
+    else:
+        transport = streamablehttp_client(args.url)
+    async with transport as streams:
+        read_stream, write_stream = streams[0], streams[1]
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                try:
+                    result = await session.call_tool(args.tool, args.arguments)
+                    if result.isError:
+                        errors.append("tool error")
+                except Exception as e:
+                    errors.append(type(e).__name__)
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+
+async def main(args: argparse.Namespace) -> None:
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_client(args, latencies, errors) for _ in range(args.clients)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    # 会话建立失败等客户端级别的异常同样计入错误
+    errors.extend(type(r).__name__ for r in results if isinstance(r, BaseException))
+
+    latencies.sort()
+    print(f"客户端数: {args.clients}，每个客户端请求数: {args.requests}，工具: {args.tool}")
+    print(f"成功: {len(latencies)}，失败: {len(errors)}，总耗时: {elapsed:.2f}s")
+    print(f"吞吐量: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(
+            f"延迟 (ms): 平均 {statistics.mean(latencies) * 1000:.1f}，"
+            f"p50 {percentile(latencies, 50) * 1000:.1f}，"
+            f"p95 {percentile(latencies, 95) * 1000:.1f}，"
+            f"p99 {percentile(latencies, 99) * 1000:.1f}，"
+            f"最大 {latencies[-1] * 1000:.1f}"
+        )
+    if errors:
+        print("错误类型:", {name: errors.count(name) for name in set(errors)})
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="天气 MCP 服务器网络模式压测工具")
+    parser.add_argument("--url", default=None,
+                        help="服务器地址，默认 http://127.0.0.1:8000/mcp（sse 模式为 /sse）")
+    parser.add_argument("--transport", choices=["streamable-http", "sse"], default="streamable-http")
+    parser.add_argument("--clients", type=int, default=20, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=10, help="每个客户端的请求数")
+    parser.add_argument("--tool", default="get_alerts", help="要调用的工具名")
+    parser.add_argument("--args", dest="arguments", type=json.loads, default={"state": "CA"},
+                        help="工具参数（JSON）")
+    args = parser.parse_args()
+    if args.url is None:
+        path = "/sse" if args.transport == "sse" else "/mcp"
+        args.url = f"http://127.0.0.1:8000{path}"
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,248 @@
+import asyncio
+import bisect
+import functools
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+# 进程内的轻量指标收集：直方图、计数器和仪表（gauge），
+# 既可以作为 MCP 资源以 JSON 形式读取，也可以导出为 Prometheus 文本格式。
+# 不依赖 prometheus_client，所有操作都在事件循环线程中完成，无需加锁。
+
+# 默认直方图桶（秒），覆盖从缓存命中的亚毫秒级到接近超时的几十秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 标签以排好序的 (名称, 取值) 元组保存，便于作为字典键
+Labels = tuple[tuple[str, str], ...]
+# 采集函数在读取指标时调用，返回 (类型, 指标名, 标签, 数值)，用于导出缓存统计等外部状态
+Collector = Callable[[], Iterable[tuple[str, str, dict[str, str], float]]]
+
+
+class Histogram:
+    """固定桶直方图，记录观测次数、总和以及落入各个桶的次数。"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # 最后一个位置对应 +Inf 桶
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按桶内线性插值估算分位数；落在 +Inf 桶时返回最大的有限边界。"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+        }
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """
+    指标注册表。
+
+    指标名在首次使用时自动创建；help 文本通过 describe() 提供，仅用于 Prometheus 导出。
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self._help: dict[str, str] = {}
+        self._collectors: list[Collector] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def histogram(self, name: str, **labels: Any) -> Histogram | None:
+        """返回指定标签的直方图，尚无观测时返回 None。"""
+        return self.histograms.get(name, {}).get(_labels(labels))
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def add(self, name: str, delta: float, **labels: Any) -> None:
+        """调整仪表的值（可正可负），用于统计进行中的请求数。"""
+        series = self.gauges.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + delta
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """记录代码块的耗时（秒），异常同样计时。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def track(self, scope: str, **labels: Any) -> Iterator[None]:
+        """
+        跟踪一次操作：{scope}_duration_seconds 记录耗时，{scope}_in_flight 记录进行中的数量，
+        抛出异常时按异常类型累加 errors_total。
+
+        被取消（如对冲请求中落败的一方）不算错误，只累加 cancelled_total，也不计入耗时，
+        以免截断的耗时拉低用于对冲延迟的 p95。
+        """
+        self.add(f"{scope}_in_flight", 1, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.inc("cancelled_total", scope=scope)
+            raise
+        except BaseException as e:
+            self.inc("errors_total", scope=scope, type=type(e).__name__)
+            self.observe(f"{scope}_duration_seconds", time.perf_counter() - start, **labels)
+            raise
+        else:
+            self.observe(f"{scope}_duration_seconds", time.perf_counter() - start, **labels)
+        finally:
+            self.add(f"{scope}_in_flight", -1, **labels)
+
+    def instrument(self, scope: str, label: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+        """装饰异步函数，以函数名作为 label 标签的取值调用 track()。"""
+        def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.track(scope, **{label: func.__name__}):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _collected(self) -> list[tuple[str, str, dict[str, str], float]]:
+        samples = []
+        for collector in self._collectors:
+            samples.extend(collector())
+        return samples
+
+    def snapshot(self) -> dict[str, Any]:
+        """以嵌套字典返回所有指标，标签拼接为 "key=value,..." 形式的字符串。"""
+        def label_key(labels: Labels) -> str:
+            return ",".join(f"{key}={value}" for key, value in labels) or "total"
+
+        result: dict[str, Any] = {
+            "histograms": {
+                name: {label_key(labels): hist.snapshot() for labels, hist in series.items()}
+                for name, series in self.histograms.items()
+            },
+            "counters": {
+                name: {label_key(labels): value for labels, value in series.items()}
+                for name, series in self.counters.items()
+            },
+            "gauges": {
+                name: {label_key(labels): value for labels, value in series.items()}
+                for name, series in self.gauges.items()
+            },
+        }
+        for kind, name, labels, value in self._collected():
+            section = "counters" if kind == "counter" else "gauges"
+            result[section].setdefault(name, {})[label_key(_labels(labels))] = value
+        return result
+
+    def render_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式（0.0.4）。"""
+        lines: list[str] = []
+
+        def header(name: str, kind: str) -> str:
+            full_name = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        for name, series in sorted(self.histograms.items()):
+            full_name = header(name, "histogram")
+            for labels, hist in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(hist.buckets + (float("inf"),), hist.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else _format_number(bound)
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_number(hist.sum)}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {hist.count}")
+
+        collected: dict[tuple[str, str], dict[Labels, float]] = {}
+        for kind, name, labels, value in self._collected():
+            collected.setdefault((name, kind), {})[_labels(labels)] = value
+        plain = [(name, "counter", series) for name, series in self.counters.items()]
+        plain += [(name, "gauge", series) for name, series in self.gauges.items()]
+        plain += [(name, kind, series) for (name, kind), series in collected.items()]
+        for name, kind, series in sorted(plain, key=lambda item: item[0]):
+            full_name = header(name, kind)
+            for labels, value in series.items():
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的指标注册表
+metrics = Metrics("nws_weather")
+metrics.describe("tool_duration_seconds", "MCP 工具调用耗时")
+metrics.describe("tool_in_flight", "正在执行的工具调用数")
+metrics.describe("upstream_duration_seconds", "NWS 上游请求耗时（含下载与解析）")
+metrics.describe("upstream_in_flight", "正在进行的 NWS 上游请求数")
+metrics.describe("upstream_responses_total", "NWS 上游响应数，按状态码统计")
+metrics.describe("stage_duration_seconds", "各阶段耗时：network 为等待响应头，parse 为下载并解析响应体，format 为格式化输出")
+metrics.describe("errors_total", "异常次数，按发生位置和异常类型统计")
+metrics.describe("cancelled_total", "被取消的操作次数（如对冲请求中落败的一方），不计入 errors_total")
+metrics.describe("cache_hits_total", "缓存命中次数")
+metrics.describe("cache_misses_total", "缓存未命中次数")
+metrics.describe("cache_hit_ratio", "缓存命中率")
+metrics.describe("cache_entries", "缓存条目数")
+metrics.describe("prefetch_tracked_keys", "记录了访问频率的缓存键数量")
+metrics.describe("prefetch_refreshes_total", "后台预取刷新的次数")
+metrics.describe("circuit_state", "熔断器状态：0 关闭，1 半开，2 打开")
+metrics.describe("hedges_total", "发出的对冲请求数")
+metrics.describe("hedge_wins_total", "对冲请求先于原请求返回的次数")
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Hashable
+
+# 热点位置的后台预取。
+#
+# AccessTracker 为每个缓存键维护按时间指数衰减的访问计数，一小时前的热点会逐渐冷却；
+# Prefetcher 定期醒来，把最热的若干个即将过期的缓存条目提前刷新，
+# 让反复被问到的城市和州几乎总能命中新鲜缓存。每轮最多发出固定数量的上游请求，
+# 以此把预取限制在上游配额的一定比例之内。
+
+logger = logging.getLogger(__name__)
+
+# 发起一次缓存刷新，返回可等待其完成的对象
+Refresher = Callable[[], Awaitable[object]]
+
+
+class AccessTracker:
+    """
+    按键统计指数衰减的访问次数。
+
+    不去逐个衰减已有分数，而是让每次新访问的权重按 2 ** (经过时间 / 半衰期) 增长，
+    比较存储的分数即可得到与衰减计数相同的排序。
+    """
+
+    def __init__(self, half_life: float = 1800, max_keys: int = 1000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._origin = time.monotonic()
+        self._scores: dict[Hashable, float] = {}
+        self._refreshers: dict[Hashable, Refresher] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def record(self, key: Hashable, refresher: Refresher) -> None:
+        """记录一次对 key 的访问，并保存刷新它的方法。"""
+        exponent = (time.monotonic() - self._origin) / self.half_life
+        if exponent > 64:
+            self._rebase()
+            exponent = (time.monotonic() - self._origin) / self.half_life
+        self._scores[key] = self._scores.get(key, 0.0) + math.pow(2.0, exponent)
+        self._refreshers[key] = refresher
+        # 超出上限一定比例后一次性淘汰最冷的键，避免每次访问都排序
+        if len(self._scores) > self.max_keys * 1.1:
+            for cold_key in sorted(self._scores, key=self._scores.get)[:len(self._scores) - self.max_keys]:
+                del self._scores[cold_key]
+                del self._refreshers[cold_key]
+
+    def _rebase(self) -> None:
+        """把基准时间移到当前，防止权重超出浮点数范围。"""
+        now = time.monotonic()
+        factor = math.pow(2.0, -(now - self._origin) / self.half_life)
+        self._scores = {key: score * factor for key, score in self._scores.items()}
+        self._origin = now
+
+    def score(self, key: Hashable) -> float:
+        """key 当前的衰减访问次数。"""
+        elapsed = (time.monotonic() - self._origin) / self.half_life
+        return self._scores.get(key, 0.0) * math.pow(2.0, -elapsed)
+
+    def hottest(self, k: int) -> list[tuple[Hashable, Refresher]]:
+        keys = sorted(self._scores, key=self._scores.get, reverse=True)[:k]
+        return [(key, self._refreshers[key]) for key in keys]
+
+
+class Prefetcher:
+    """定期在过期前刷新最热的缓存键。"""
+
+    def __init__(
+        self,
+        tracker: AccessTracker,
+        expires_in: Callable[[Hashable], float | None],
+        top_k: int,
+        interval: float,
+        lead_time: float,
+        budget_per_cycle: int,
+    ):
+        self.tracker = tracker
+        # 返回键距离过期的秒数，未缓存时返回 None
+        self.expires_in = expires_in
+        self.top_k = top_k
+        self.interval = interval
+        self.lead_time = lead_time
+        self.budget_per_cycle = budget_per_cycle
+        self.refreshed = 0
+        self.failed = 0
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        """刷新将在 lead_time 内过期的热点键，返回本轮刷新的数量。"""
+        due = []
+        for key, refresher in self.tracker.hottest(self.top_k):
+            remaining = self.expires_in(key)
+            if remaining is not None and remaining <= self.lead_time:
+                due.append(refresher)
+                if len(due) >= self.budget_per_cycle:
+                    break
+        results = await asyncio.gather(*(refresher() for refresher in due), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception) or result is None)
+        self.refreshed += len(results) - failed
+        self.failed += failed
+        return len(results)
+
+    def start(self) -> None:
+        """启动后台预取任务（重复调用无副作用）。"""
+        if (self._task is None or self._task.done()) and self.top_k > 0 and self.budget_per_cycle > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("预取失败")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
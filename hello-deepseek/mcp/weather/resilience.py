@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+# 上游容错工具：按端点划分的熔断器与对冲请求（hedged request）。
+#
+# 熔断器在连续失败（或响应过慢）达到阈值后打开，打开期间直接失败，不再占用连接和协程；
+# 冷却时间过后放行一个探测请求，成功则恢复，失败则继续打开。
+# 对冲请求在首个请求超过一定延迟（通常取该端点的 p95）仍未返回时再发一个相同请求，
+# 谁先成功用谁，另一个立即取消。
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# 导出为指标时使用的数值
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝。"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"{name} 上游熔断中，{self.retry_after:.0f} 秒后重试")
+
+
+class EndpointPolicy:
+    """单个上游端点的超时、熔断与对冲配置。"""
+
+    FIELDS = ("timeout", "failure_threshold", "slow_threshold", "reset_timeout", "hedge", "hedge_delay")
+
+    def __init__(
+        self,
+        timeout: float,
+        failure_threshold: int,
+        slow_threshold: float,
+        reset_timeout: float,
+        hedge: bool = False,
+        hedge_delay: float = 1.0,
+    ):
+        # 单次尝试的超时（秒）
+        self.timeout = timeout
+        # 连续失败多少次后打开熔断器
+        self.failure_threshold = failure_threshold
+        # 超过该耗时（秒）的成功响应也计为一次失败
+        self.slow_threshold = slow_threshold
+        # 打开后多久（秒）放行探测请求
+        self.reset_timeout = reset_timeout
+        # 是否启用对冲请求，以及样本不足以估计 p95 时使用的对冲延迟（秒）
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+
+    def with_overrides(self, overrides: dict[str, Any]) -> "EndpointPolicy":
+        unknown = overrides.keys() - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"未知的端点配置项: {', '.join(sorted(unknown))}")
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(overrides)
+        return EndpointPolicy(**values)
+
+
+def load_policies(default: EndpointPolicy, overrides_json: str | None) -> dict[str, EndpointPolicy]:
+    """
+    解析按端点覆盖的配置，例如 '{"forecast": {"hedge": true}, "alerts": {"timeout": 10}}'。
+
+    返回 {端点名: 配置}；未出现的端点使用 default。
+    """
+    if not overrides_json:
+        return {}
+    return {endpoint: default.with_overrides(values) for endpoint, values in json.loads(overrides_json).items()}
+
+
+class CircuitBreaker:
+    """连续失败计数型熔断器。"""
+
+    def __init__(self, name: str, policy: EndpointPolicy):
+        self.name = name
+        self.policy = policy
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_request(self) -> None:
+        """请求前调用：熔断器打开时抛出 CircuitOpenError；半开状态下同一时间只放行一个探测请求。"""
+        if self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.policy.reset_timeout - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(self.name, remaining)
+
+    def record_success(self, duration: float) -> None:
+        self._probing = False
+        if duration > self.policy.slow_threshold:
+            self.record_failure()
+            return
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.policy.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """请求既不算成功也不算失败时（如被取消、4xx）归还探测名额。"""
+        self._probing = False
+
+
+async def hedged(
+    call: Callable[[int], Awaitable[Any]],
+    delay: float,
+    on_hedge: Callable[[], None] | None = None,
+) -> tuple[Any, bool]:
+    """
+    执行 call(0)；若 delay 秒后仍未完成，再并发执行 call(1)，返回最先成功的结果。
+
+    两次尝试都失败时抛出最后一个异常。返回 (结果, 是否由对冲请求获胜)。
+    无论结果如何，未完成的尝试都会被取消并等待其退出，不会遗留协程。
+    """
+    tasks = [asyncio.create_task(call(0))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.append(asyncio.create_task(call(1)))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is not tasks[0]
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
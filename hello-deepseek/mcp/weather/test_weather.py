@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+from collections.abc import Awaitable, Callable
+
+import httpx
+import pytest
+
+# 网格点缓存写到内存里，不碰用户目录下的缓存文件；必须在导入 weather 之前设置
+os.environ.setdefault("NWS_GRID_CACHE_PATH", ":memory:")
+
+import weather  # noqa: E402
+from resilience import CLOSED  # noqa: E402
+
+
+def make_alert(event: str, severity: str, urgency: str = "Expected", ugc: str = "CAZ006") -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Polygon", "coordinates": [[[-122.0, 37.0], [-121.0, 37.0], [-121.0, 38.0]]]},
+        "properties": {
+            "event": event,
+            "areaDesc": "San Francisco",
+            "severity": severity,
+            "urgency": urgency,
+            "sent": "2024-01-01T00:00:00+00:00",
+            "description": f"{event} description",
+            "geocode": {"UGC": [ugc]},
+        },
+    }
+
+
+def feed(*features: dict) -> bytes:
+    return json.dumps({"type": "FeatureCollection", "features": list(features)}).encode()
+
+
+def run(handler: Callable[[httpx.Request], Awaitable[httpx.Response]], coro: Callable[[], Awaitable]):
+    """把共享客户端换成 MockTransport 后在新的事件循环中运行 coro。"""
+    async def main():
+        weather._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await coro()
+        finally:
+            await weather.close_http_client()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    weather.response_cache.clear()
+    weather.response_cache.revalidated = 0
+    weather._inflight.clear()
+    weather._breakers.clear()
+    yield
+    weather.response_cache.clear()
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=feed(make_alert("Flood Warning", "Severe")))
+
+    async def five_calls():
+        return await asyncio.gather(*(weather.get_alerts("CA") for _ in range(5)))
+
+    results = run(handler, five_calls)
+    assert len(requests) == 1
+    assert all(result == results[0] for result in results)
+    assert "Flood Warning" in results[0]
+
+
+def test_stale_entry_is_revalidated_with_etag():
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"', "Cache-Control": "max-age=0"})
+        body = feed(make_alert("Heat Advisory", "Moderate"))
+        return httpx.Response(200, content=body, headers={"ETag": '"v1"', "Cache-Control": "max-age=0"})
+
+    async def two_calls():
+        return await weather.get_alerts("CA"), await weather.get_alerts("CA")
+
+    first, second = run(handler, two_calls)
+    assert len(requests) == 2
+    assert "if-none-match" not in requests[0].headers
+    assert requests[1].headers["if-none-match"] == '"v1"'
+    assert second == first
+    assert weather.response_cache.revalidated == 1
+
+
+def test_filters_are_sent_upstream_and_limit_keeps_most_severe():
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=feed(
+            make_alert("Wind Advisory", "Severe"),
+            make_alert("Tornado Warning", "Extreme", "Immediate"),
+            make_alert("Frost Advisory", "Minor"),  # 上游没有过滤时也会在解析时被筛掉
+            make_alert("Flood Warning", "Severe", "Immediate"),
+        ))
+
+    result = run(handler, lambda: weather.get_alerts("TX", severity=["severe", "EXTREME"], urgency=["immediate"], limit=1))
+    url = requests[0].url
+    assert url.path == "/alerts/active"
+    assert url.params["area"] == "TX"
+    assert url.params["severity"] == "Extreme,Severe"
+    assert url.params["urgency"] == "Immediate"
+    assert "Tornado Warning" in result
+    assert "Flood Warning" not in result
+    assert "共 2 条预警，仅显示最重要的 1 条。" in result
+
+
+def test_invalid_areas_are_reported_without_breaking_valid_ones():
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=feed(make_alert("Flood Warning", "Severe")))
+
+    result = run(handler, lambda: weather.get_regional_alerts(["ca", "XYZ1", " "]))
+    assert len(requests) == 1
+    assert requests[0].url.path == "/alerts/active/area/CA"
+    assert "=== CA ===" in result and "Flood Warning" in result
+    assert "=== XYZ1 ===\n无效的区域代码。" in result
+
+
+def test_rejected_area_returns_error_without_tripping_breaker():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={"title": "Bad Request"})
+
+    async def repeated_calls():
+        return [await weather.get_alerts("ZZ") for _ in range(weather.BREAKER_FAILURES + 1)]
+
+    assert set(run(handler, repeated_calls)) == {"无法获取预警信息或未找到相关数据。"}
+    # 4xx 是请求本身的问题，不应计入熔断
+    assert weather.get_breaker("alerts").state == CLOSED
+
+
+def test_regional_alerts_keep_top_n_per_area():
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        california = [make_alert(f"CA Warning {i}", "Severe", ugc="CAZ006") for i in range(5)]
+        return httpx.Response(200, content=feed(
+            *california,
+            make_alert("CA Tornado Warning", "Extreme", "Immediate", ugc="CAZ007"),
+            make_alert("NV Wind Advisory", "Minor", ugc="NVZ001"),
+        ))
+
+    result = run(handler, lambda: weather.get_regional_alerts(["CA", "NV"], limit_per_area=2))
+    assert len(requests) == 1
+    assert requests[0].url.params["area"] == "CA,NV"
+    california, nevada = result.split("\n\n=== NV ===\n")
+    assert "CA Tornado Warning" in california
+    assert california.count("事件: ") == 2
+    assert "共 6 条预警，仅显示最重要的 2 条。" in california
+    # 加州的预警再多也不会挤掉同一批中其他州的预警
+    assert "NV Wind Advisory" in nevada
@@ -1,10 +1,24 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import re
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from functools import partial
+from contextlib import asynccontextmanager
 from typing import Any
 import httpx
+import uvicorn
 from mcp.server.fastmcp import FastMCP
-
-# 1. 初始化 FastMCP 服务器
-# 创建一个名为 "weather" 的服务器实例。这个名字有助于识别这套工具。
-mcp = FastMCP("weather")
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from alerts import SEVERITY_RANK, URGENCY_RANK, parse_alert_stream
+from cache import CachedResponse, grid_cache, response_cache
+from metrics import metrics
+from prefetch import AccessTracker, Prefetcher
+from resilience import STATE_VALUES, CircuitBreaker, CircuitOpenError, EndpointPolicy, hedged, load_policies
 
 # --- 常量定义 ---
 # 美国国家气象局 (NWS) API 的基础 URL
@@ -12,35 +26,432 @@ NWS_API_BASE = "https://api.weather.gov"
 # 设置请求头中的 User-Agent，很多公共 API 要求提供此信息以识别客户端
 USER_AGENT = "weather-app/1.0"
 
+# --- HTTP 连接池配置 ---
+# 均可通过环境变量覆盖，便于在不同部署环境下调优
+# 整体请求超时（秒），以及建立连接阶段的超时
+HTTP_TIMEOUT = float(os.getenv("NWS_HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("NWS_HTTP_CONNECT_TIMEOUT", "10"))
+# 连接池上限：最大并发连接数、最大空闲保活连接数，以及空闲连接的保活时长（秒）
+HTTP_MAX_CONNECTIONS = int(os.getenv("NWS_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("NWS_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("NWS_HTTP_KEEPALIVE_EXPIRY", "60"))
+# 是否启用 HTTP/2 多路复用（需要安装 h2，即 httpx[http2]）
+HTTP2_ENABLED = os.getenv("NWS_HTTP2", "1") != "0"
+
+# --- 多区域预警查询配置 ---
+# 同时进行的上游请求数上限
+ALERTS_MAX_CONCURRENCY = int(os.getenv("NWS_ALERTS_MAX_CONCURRENCY", "4"))
+# 合并到同一个 area= / zone= 请求中的区域数量上限
+ALERTS_BATCH_SIZE = int(os.getenv("NWS_ALERTS_BATCH_SIZE", "10"))
+# 区域代码格式：两个字母的州或海域代码（CA、PZ），或者 UGC 预报区/县代码（CAZ006、TXC201）
+AREA_CODE_PATTERN = re.compile(r"^[A-Z]{2}$")
+ZONE_CODE_PATTERN = re.compile(r"^[A-Z]{2}[ZC]\d{3}$")
+# get_alerts 默认最多返回的预警条数，避免恶劣天气爆发时结果超出模型上下文
+ALERTS_DEFAULT_LIMIT = int(os.getenv("NWS_ALERTS_DEFAULT_LIMIT", "10"))
+
+# --- 上游容错配置 ---
+# 以下为所有端点（points、forecast、forecast_hourly、alerts）的默认值，
+# 可通过 NWS_ENDPOINT_POLICIES 按端点覆盖，例如 '{"forecast": {"hedge": true, "timeout": 8}}'
+# 单次请求尝试的超时（秒）
+UPSTREAM_TIMEOUT = float(os.getenv("NWS_UPSTREAM_TIMEOUT", str(HTTP_TIMEOUT)))
+# 熔断器：连续失败次数阈值、计为失败的慢响应耗时（秒）、打开后的冷却时间（秒）
+BREAKER_FAILURES = int(os.getenv("NWS_BREAKER_FAILURES", "5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("NWS_BREAKER_SLOW_SECONDS", "10"))
+BREAKER_RESET_SECONDS = float(os.getenv("NWS_BREAKER_RESET_SECONDS", "30"))
+# 对冲请求：默认关闭；延迟取该端点上游耗时的 p95，样本不足时使用 NWS_HEDGE_DELAY
+HEDGE_ENABLED = os.getenv("NWS_HEDGE", "0") == "1"
+HEDGE_DEFAULT_DELAY = float(os.getenv("NWS_HEDGE_DELAY", "1.0"))
+HEDGE_MIN_DELAY = float(os.getenv("NWS_HEDGE_MIN_DELAY", "0.05"))
+# 估计 p95 所需的最少样本数
+HEDGE_MIN_SAMPLES = 20
+DEFAULT_POLICY = EndpointPolicy(
+    timeout=UPSTREAM_TIMEOUT,
+    failure_threshold=BREAKER_FAILURES,
+    slow_threshold=BREAKER_SLOW_SECONDS,
+    reset_timeout=BREAKER_RESET_SECONDS,
+    hedge=HEDGE_ENABLED,
+    hedge_delay=HEDGE_DEFAULT_DELAY,
+)
+ENDPOINT_POLICIES = load_policies(DEFAULT_POLICY, os.getenv("NWS_ENDPOINT_POLICIES"))
+
+# --- 热点预取配置 ---
+# 保持新鲜的最热缓存键数量（0 表示关闭预取）、预取周期（秒）、提前多久刷新即将过期的条目（秒）
+PREFETCH_TOP_K = int(os.getenv("NWS_PREFETCH_TOP_K", "30"))
+PREFETCH_INTERVAL = float(os.getenv("NWS_PREFETCH_INTERVAL", "30"))
+PREFETCH_LEAD_TIME = float(os.getenv("NWS_PREFETCH_LEAD_TIME", "60"))
+# 访问计数的半衰期（秒）
+PREFETCH_HALF_LIFE = float(os.getenv("NWS_PREFETCH_HALF_LIFE", "1800"))
+# NWS 没有公开的固定配额，这里设定每分钟的上游请求预算，预取最多占用其中的一定比例
+UPSTREAM_QUOTA_PER_MINUTE = float(os.getenv("NWS_UPSTREAM_QUOTA_PER_MINUTE", "60"))
+PREFETCH_QUOTA_SHARE = float(os.getenv("NWS_PREFETCH_QUOTA_SHARE", "0.2"))
+
+# 整个服务器进程共享的 HTTP 客户端，首次请求时创建，服务器关闭时释放
+_http_client: httpx.AsyncClient | None = None
+# 正在进行中的上游请求，按 URL 索引，用于合并并发的相同请求
+_inflight: dict[str, asyncio.Task] = {}
+
+
+# --- HTTP 客户端生命周期 ---
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    返回共享的 httpx.AsyncClient，必要时创建。
+
+    所有工具调用复用同一个连接池，避免每次请求都重新进行 TCP + TLS 握手。
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/geo+json"  # NWS API 推荐的 Accept 头
+            },
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            # 未安装 h2 时自动退回 HTTP/1.1，而不是在创建客户端时报错
+            http2=HTTP2_ENABLED and importlib.util.find_spec("h2") is not None,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """关闭共享的 HTTP 客户端，释放连接池中的所有连接。"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def release_shared_resources() -> None:
+    """释放整个进程共享的资源：后台预取任务、HTTP 连接池与网格点缓存的数据库连接。"""
+    await prefetcher.stop()
+    await close_http_client()
+    grid_cache.close()
+
+
+# 网络传输模式下，共享资源由 ASGI 应用的生命周期负责释放，而不是单个 MCP 会话
+_network_mode = False
+
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    服务器生命周期：退出时确保共享连接池被干净地关闭。
+
+    stdio 模式下一个进程只有一个会话，会话结束即进程结束；
+    网络模式下每个客户端会话（无状态模式下甚至每个请求）都会进入一次这里，
+    此时不能在会话结束时关闭被所有客户端共享的连接池。
+    后台预取任务在第一个会话开始时启动，之后的会话不会重复启动。
+    """
+    prefetcher.start()
+    try:
+        yield
+    finally:
+        if not _network_mode:
+            await release_shared_resources()
+
+
+# --- 指标 ---
+
+# Prometheus 文本格式的 Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def endpoint_label(url: str) -> str:
+    """把 NWS URL 归类为有限的几个端点名，避免以完整 URL 作为标签导致指标数量膨胀。"""
+    path = url.removeprefix(NWS_API_BASE).split("?")[0]
+    if path.startswith("/points/"):
+        return "points"
+    if path.startswith("/gridpoints/"):
+        return "forecast_hourly" if path.endswith("/hourly") else "forecast"
+    if path.startswith("/alerts"):
+        return "alerts"
+    return "other"
+
+
+def cache_samples() -> Iterator[tuple[str, str, dict[str, str], float]]:
+    """在读取指标时导出两级缓存的统计与命中率。"""
+    response_stats = response_cache.stats()
+    grid_stats = grid_cache.stats()
+    # 304 重新验证虽然省下了响应体，但仍有一次上游往返，因此不算命中
+    response_misses = response_stats["misses"] + response_stats["revalidated"]
+    yield ("gauge", "cache_entries", {"cache": "response"}, response_stats["entries"])
+    for cache, hits, misses in (
+        ("response", response_stats["hits"], response_misses),
+        ("gridpoint", grid_stats["hits"], grid_stats["misses"]),
+    ):
+        yield ("counter", "cache_hits_total", {"cache": cache}, hits)
+        yield ("counter", "cache_misses_total", {"cache": cache}, misses)
+        yield ("gauge", "cache_hit_ratio", {"cache": cache}, round(hits / (hits + misses), 4) if hits + misses else 0.0)
+
+
+metrics.register_collector(cache_samples)
+
+
+# 每个端点一个熔断器，首次请求该端点时创建
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    if endpoint not in _breakers:
+        _breakers[endpoint] = CircuitBreaker(endpoint, ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY))
+    return _breakers[endpoint]
+
+
+def breaker_samples() -> Iterator[tuple[str, str, dict[str, str], float]]:
+    for endpoint, breaker in _breakers.items():
+        yield ("gauge", "circuit_state", {"endpoint": endpoint}, STATE_VALUES[breaker.state])
+
+
+metrics.register_collector(breaker_samples)
+
+
+def cache_expires_in(key: str) -> float | None:
+    """缓存条目距离过期的秒数，未缓存时返回 None。"""
+    entry = response_cache.peek(key)
+    return entry.expires_at - time.monotonic() if entry is not None else None
+
+
+# 进程内共享的访问频率统计与后台预取器
+access_tracker = AccessTracker(half_life=PREFETCH_HALF_LIFE, max_keys=response_cache.max_entries)
+prefetcher = Prefetcher(
+    access_tracker,
+    cache_expires_in,
+    top_k=PREFETCH_TOP_K,
+    interval=PREFETCH_INTERVAL,
+    lead_time=PREFETCH_LEAD_TIME,
+    budget_per_cycle=int(UPSTREAM_QUOTA_PER_MINUTE * PREFETCH_QUOTA_SHARE * PREFETCH_INTERVAL / 60),
+)
+
+
+def prefetch_samples() -> Iterator[tuple[str, str, dict[str, str], float]]:
+    yield ("gauge", "prefetch_tracked_keys", {}, len(access_tracker))
+    yield ("counter", "prefetch_refreshes_total", {"result": "ok"}, prefetcher.refreshed)
+    yield ("counter", "prefetch_refreshes_total", {"result": "error"}, prefetcher.failed)
+
+
+metrics.register_collector(prefetch_samples)
+
+
+def hedge_delay(endpoint: str, policy: EndpointPolicy) -> float:
+    """对冲延迟：该端点上游耗时的 p95，样本不足时使用配置的默认值，且不超过单次超时。"""
+    hist = metrics.histogram("upstream_duration_seconds", endpoint=endpoint)
+    if hist is None or hist.count < HEDGE_MIN_SAMPLES:
+        return policy.hedge_delay
+    return min(max(hist.quantile(0.95), HEDGE_MIN_DELAY), policy.timeout)
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """判断一次异常是否说明上游不健康：4xx（429 除外）是请求本身的问题，不计入熔断。"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return True
+
+
+# 工具装饰器：记录每个工具的耗时、进行中的调用数与异常
+instrumented = metrics.instrument("tool", label="tool")
+
+
+# 1. 初始化 FastMCP 服务器
+# 创建一个名为 "weather" 的服务器实例。这个名字有助于识别这套工具。
+# lifespan 让共享的 HTTP 客户端跟随服务器一起启动和关闭。
+mcp = FastMCP("weather", lifespan=server_lifespan)
+
 
 # --- 辅助函数 ---
 
-async def make_nws_request(url: str) -> dict[str, Any] | None:
+async def make_nws_request(
+    url: str,
+    parser: Callable[[httpx.Response], Awaitable[Any]] | None = None,
+    variant: str = "",
+) -> dict[str, Any] | None:
     """
     一个通用的异步函数，用于向 NWS API 发起请求并处理常见的错误。
 
     Args:
         url (str): 要请求的完整 URL。
+        parser: 可选的流式解析函数，接收尚未读取响应体的 httpx.Response 并返回解析结果；
+            为空时按普通 JSON 解析。
+        variant (str): 解析方式的标识。同一 URL 使用不同解析方式时，结果分别缓存和合并。
 
     Returns:
         dict[str, Any] | None: 成功时返回解析后的 JSON 字典，失败时返回 None。
     """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"  # NWS API 推荐的 Accept 头
+    key = f"{url}#{variant}" if variant else url
+    # 记录访问频率，热点请求会在缓存过期前被后台预取刷新
+    access_tracker.record(key, partial(refresh_nws_request, url, key, parser))
+    # 先查响应缓存：仍在新鲜期内的条目直接返回，不发起网络请求
+    cached = response_cache.get(key)
+    if cached is not None and cached.is_fresh():
+        response_cache.hits += 1
+        return cached.data
+    return await asyncio.shield(_start_fetch(url, key, cached, parser))
+
+def _start_fetch(
+    url: str,
+    key: str,
+    cached: CachedResponse | None,
+    parser: Callable[[httpx.Response], Awaitable[Any]] | None,
+) -> asyncio.Task:
+    """
+    单飞（single-flight）：同一请求同时只允许一个上游请求，其余调用者等待同一个结果。
+
+    请求作为独立任务运行，某个调用者被取消不会影响其他等待者；
+    任务结束后立即从表中移除，失败结果（None）不会影响之后的调用。
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_nws(url, key, cached, parser))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+    return task
+
+def refresh_nws_request(
+    url: str,
+    key: str,
+    parser: Callable[[httpx.Response], Awaitable[Any]] | None,
+) -> asyncio.Task:
+    """预取使用：不论缓存是否新鲜都向上游刷新（有验证器时为条件请求）。"""
+    return _start_fetch(url, key, response_cache.peek(key), parser)
+
+async def _fetch_nws(
+    url: str,
+    key: str,
+    cached: CachedResponse | None,
+    parser: Callable[[httpx.Response], Awaitable[Any]] | None,
+) -> dict[str, Any] | None:
+    """
+    实际向 NWS 发起请求；cached 为已过期的缓存条目时发送条件请求。
+
+    每次尝试都有独立的超时；所属端点的熔断器打开时直接返回 None，
+    端点启用对冲时，慢请求会在 p95 延迟后补发一个相同请求，先成功者胜出。
+    """
+    endpoint = endpoint_label(url)
+    policy = ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY)
+    breaker = get_breaker(endpoint)
+    try:
+        breaker.before_request()
+    except CircuitOpenError as e:
+        # 熔断期间直接失败，不占用连接，也不会让调用者等满超时
+        metrics.inc("errors_total", scope="upstream", type=type(e).__name__)
+        return None
+    # 过期的条目带上 If-None-Match / If-Modified-Since 做条件请求
+    headers = cached.conditional_headers() if cached is not None else None
+
+    async def attempt(_: int) -> tuple[httpx.Response, Any]:
+        # 复用共享的 httpx.AsyncClient，请求头与超时已在客户端上统一配置
+        client = get_http_client()
+        with metrics.track("upstream", endpoint=endpoint):
+            async with asyncio.timeout(policy.timeout):
+                started = time.perf_counter()
+                # 以流的方式发起请求，响应体交给解析函数边下载边处理
+                async with client.stream("GET", url, headers=headers) as response:
+                    metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="network")
+                    metrics.inc("upstream_responses_total", endpoint=endpoint, status=response.status_code)
+                    # 304 表示数据未变化，响应体为空，由调用方沿用缓存内容
+                    if response.status_code == 304 and cached is not None:
+                        return response, None
+                    # 如果响应状态码是 4xx 或 5xx（表示客户端或服务器错误），则会引发一个异常
+                    response.raise_for_status()
+                    # 如果请求成功，解析响应体
+                    with metrics.timer("stage_duration_seconds", stage="parse"):
+                        if parser is None:
+                            await response.aread()
+                            return response, response.json()
+                        return response, await parser(response)
+
+    started = time.perf_counter()
+    try:
+        if policy.hedge:
+            (response, data), hedge_won = await hedged(
+                attempt,
+                hedge_delay(endpoint, policy),
+                on_hedge=partial(metrics.inc, "hedges_total", endpoint=endpoint),
+            )
+            if hedge_won:
+                metrics.inc("hedge_wins_total", endpoint=endpoint)
+        else:
+            response, data = await attempt(0)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        # 捕获所有可能的异常（如网络问题、超时、HTTP错误等），并返回 None；异常类型已计入 errors_total
+        if is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        return None
+    breaker.record_success(time.perf_counter() - started)
+
+    # 304：沿用缓存内容并刷新其过期时间
+    if response.status_code == 304 and cached is not None:
+        response_cache.revalidated += 1
+        response_cache.refresh(key, response.headers)
+        return cached.data
+    # 按响应头决定是否写入缓存
+    response_cache.misses += 1
+    response_cache.store(key, response.headers, data)
+    return data
+
+async def fetch_alerts(
+    url: str,
+    severity: set[str] | None = None,
+    urgency: set[str] | None = None,
+    limit: int | None = None,
+    areas: list[str] | None = None,
+) -> dict[str, Any] | None:
+    """
+    请求预警数据并以流的方式解析，只保留筛选后最重要的 limit 条预警（不含 geometry）。
+
+    给出 areas 时按区域分组，每个区域各保留 limit 条，结果格式见 parse_alert_stream。
+    """
+    parser = partial(parse_alert_stream, severity=severity, urgency=urgency, limit=limit, areas=areas)
+    variant = f"alerts:{sorted(severity or [])}:{sorted(urgency or [])}:{limit}:{','.join(areas or [])}"
+    return await make_nws_request(url, parser=parser, variant=variant)
+
+def normalize_levels(values: list[str] | None, allowed: dict[str, int]) -> set[str] | None:
+    """把用户给出的严重性/紧急程度取值规范为 NWS 的写法（如 severe → Severe），忽略无效值。"""
+    if not values:
+        return None
+    levels = {value.strip().capitalize() for value in values} & allowed.keys()
+    return levels or None
+
+async def resolve_gridpoint(latitude: float, longitude: float, refresh: bool = False) -> dict[str, Any] | None:
+    """
+    把经纬度解析为 NWS 网格点信息（包含预报接口 URL）。
+
+    优先读取持久化的网格点缓存；未命中（或 refresh=True）时才请求 /points 接口并写回缓存。
+    请求时使用与缓存键相同的取整坐标，保证缓存内容与键完全对应。
+    返回的字典中 "cached" 字段标记本次结果是否来自缓存。
+    """
+    if not refresh:
+        cached = grid_cache.get(latitude, longitude)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    lat, lon = grid_cache.round_coords(latitude, longitude)
+    points_data = await make_nws_request(f"{NWS_API_BASE}/points/{lat},{lon}")
+    if not points_data or "properties" not in points_data:
+        return None
+
+    props = points_data["properties"]
+    gridpoint = {
+        "forecast": props.get("forecast"),
+        "forecastHourly": props.get("forecastHourly"),
+        "gridId": props.get("gridId"),
+        "gridX": props.get("gridX"),
+        "gridY": props.get("gridY"),
     }
-    # 使用 httpx.AsyncClient 来执行异步 HTTP GET 请求
-    async with httpx.AsyncClient() as client:
-        try:
-            # 发起请求，设置了30秒的超时
-            response = await client.get(url, headers=headers, timeout=30.0)
-            # 如果响应状态码是 4xx 或 5xx（表示客户端或服务器错误），则会引发一个异常
-            response.raise_for_status()
-            # 如果请求成功，返回 JSON 格式的响应体
-            return response.json()
-        except Exception:
-            # 捕获所有可能的异常（如网络问题、超时、HTTP错误等），并返回 None
-            return None
+    if not gridpoint["forecast"]:
+        return None
+    grid_cache.set(latitude, longitude, gridpoint)
+    return {**gridpoint, "cached": False}
 
 def format_alert(feature: dict) -> str:
     """将单个天气预警的 JSON 数据格式化为人类可读的字符串。"""
@@ -54,35 +465,94 @@ def format_alert(feature: dict) -> str:
 指令: {props.get('instruction', '无具体指令')}
 """
 
+async def fetch_alerts_batch(
+    param: str,
+    codes: list[str],
+    semaphore: asyncio.Semaphore,
+    limit: int,
+) -> dict[str, dict[str, Any] | None]:
+    """
+    用一次 area= 或 zone= 请求获取一批区域的预警，并按区域分组。
+
+    解析时每个区域只保留最重要的 limit 条，批量请求的结果大小同样有界。
+    NWS 对整个请求做参数校验，只要有一个代码无效整批都会失败，
+    因此合并请求失败时退回为逐个区域请求，保留能成功的部分。
+    返回 {区域代码: {"features": 预警列表, "total": 预警总数}}，获取失败的区域对应 None。
+    """
+    # 单个州使用与 get_alerts 相同的路径形式，其余情况合并到一个查询参数中
+    if param == "area" and len(codes) == 1:
+        url = f"{NWS_API_BASE}/alerts/active/area/{codes[0]}"
+    else:
+        url = f"{NWS_API_BASE}/alerts/active?{param}={','.join(codes)}"
+    async with semaphore:
+        data = await fetch_alerts(url, limit=limit, areas=codes)
+
+    if data and "areas" in data:
+        return data["areas"]
+    if len(codes) == 1:
+        return {codes[0]: None}
+
+    results: dict[str, dict[str, Any] | None] = {}
+    for single in await asyncio.gather(*(fetch_alerts_batch(param, [code], semaphore, limit) for code in codes)):
+        results.update(single)
+    return results
+
 # --- MCP 工具定义 ---
 
 @mcp.tool()
-async def get_alerts(state: str) -> str:
+@instrumented
+async def get_alerts(
+    state: str,
+    severity: list[str] | None = None,
+    urgency: list[str] | None = None,
+    limit: int = ALERTS_DEFAULT_LIMIT,
+) -> str:
     """
     获取美国某个州当前生效的天气预警信息。
     这个函数被 @mcp.tool() 装饰器标记，意味着它可以被大模型作为工具来调用。
+    结果按严重性、紧急程度和发布时间排序，只返回最重要的若干条。
 
     参数:
         state: 两个字母的美国州代码 (例如: CA, NY)。
+        severity: 可选，只返回这些严重性的预警 (Extreme, Severe, Moderate, Minor)。
+        urgency: 可选，只返回这些紧急程度的预警 (Immediate, Expected, Future, Past)。
+        limit: 最多返回的预警条数。
     """
-    # 构造请求特定州天气预警的 URL
-    url = f"{NWS_API_BASE}/alerts/active/area/{state}"
-    data = await make_nws_request(url)
+    severity_levels = normalize_levels(severity, SEVERITY_RANK)
+    urgency_levels = normalize_levels(urgency, URGENCY_RANK)
+    limit = max(1, limit)
+
+    # 构造请求特定州天气预警的 URL；有筛选条件时交给 NWS 在服务端过滤，减少下载量
+    if severity_levels or urgency_levels:
+        url = f"{NWS_API_BASE}/alerts/active?area={state}"
+        if severity_levels:
+            url += f"&severity={','.join(sorted(severity_levels))}"
+        if urgency_levels:
+            url += f"&urgency={','.join(sorted(urgency_levels))}"
+    else:
+        url = f"{NWS_API_BASE}/alerts/active/area/{state}"
+    # 边下载边解析，筛选和取前 N 条在解析过程中完成
+    data = await fetch_alerts(url, severity_levels, urgency_levels, limit)
 
     # 健壮性检查：如果请求失败或返回的数据格式不正确
     if not data or "features" not in data:
         return "无法获取预警信息或未找到相关数据。"
 
-    # 如果 features 列表为空，说明该州当前没有生效的预警
+    # 如果 features 列表为空，说明该州当前没有生效的（符合条件的）预警
     if not data["features"]:
         return "该州当前没有生效的天气预警。"
 
-    # 使用列表推导和 format_alert 函数来格式化所有预警信息
-    alerts = [format_alert(feature) for feature in data["features"]]
-    # 将所有预警信息用分隔线连接成一个字符串并返回
-    return "\n---\n".join(alerts)
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        # 使用列表推导和 format_alert 函数来格式化所有预警信息
+        alerts = [format_alert(feature) for feature in data["features"]]
+        # 将所有预警信息用分隔线连接成一个字符串并返回
+        result = "\n---\n".join(alerts)
+        if data["total"] > len(alerts):
+            result += f"\n---\n共 {data['total']} 条预警，仅显示最重要的 {len(alerts)} 条。"
+    return result
 
 @mcp.tool()
+@instrumented
 async def get_forecast(latitude: float, longitude: float) -> str:
     """
     根据给定的经纬度获取天气预报。
@@ -93,44 +563,174 @@ async def get_forecast(latitude: float, longitude: float) -> str:
         longitude: 地点的经度
     """
     # NWS API 获取预报需要两步
-    # 第一步：根据经纬度获取一个包含具体预报接口 URL 的网格点信息
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+    # 第一步：根据经纬度获取一个包含具体预报接口 URL 的网格点信息（命中缓存时无需请求）
+    gridpoint = await resolve_gridpoint(latitude, longitude)
 
-    if not points_data:
+    if not gridpoint:
         return "无法获取该地点的预报数据。"
 
-    # 第二步：从上一步的响应中提取实际的天气预报接口 URL
-    forecast_url = points_data["properties"]["forecast"]
-    # 第三步：请求详细的天气预报数据
-    forecast_data = await make_nws_request(forecast_url)
+    # 第二步：请求详细的天气预报数据
+    forecast_data = await make_nws_request(gridpoint["forecast"])
+
+    if not forecast_data and gridpoint["cached"]:
+        # 缓存的预报 URL 可能已失效（NWS 偶尔会调整网格），重新解析一次再试
+        gridpoint = await resolve_gridpoint(latitude, longitude, refresh=True)
+        if gridpoint:
+            forecast_data = await make_nws_request(gridpoint["forecast"])
 
     if not forecast_data:
         return "无法获取详细的预报信息。"
 
-    # 提取预报周期数据
-    periods = forecast_data["properties"]["periods"]
-    forecasts = []
-    # 遍历接下来的5个预报周期（例如：今天下午、今晚、明天...）
-    for period in periods[:5]:
-        forecast = f"""
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        # 提取预报周期数据
+        periods = forecast_data["properties"]["periods"]
+        forecasts = []
+        # 遍历接下来的5个预报周期（例如：今天下午、今晚、明天...）
+        for period in periods[:5]:
+            forecast = f"""
 {period['name']}:
 温度: {period['temperature']}°{period['temperatureUnit']}
 风力: {period['windSpeed']} {period['windDirection']}
 预报: {period['detailedForecast']}
 """
-        forecasts.append(forecast)
+            forecasts.append(forecast)
+
+        # 将格式化后的预报信息连接成一个字符串并返回
+        return "\n---\n".join(forecasts)
+
+
+@mcp.tool()
+@instrumented
+async def get_regional_alerts(areas: list[str], limit_per_area: int = ALERTS_DEFAULT_LIMIT) -> str:
+    """
+    一次获取多个州、海域或预报区当前生效的天气预警，结果按区域分组。
+    适合需要整片区域预警的场景，避免逐个州反复调用 get_alerts。
+
+    参数:
+        areas: 区域代码列表，可以是两个字母的州代码（例如: CA, NV）
+               或 UGC 预报区代码（例如: CAZ006）。
+        limit_per_area: 每个区域最多返回的预警条数（按重要性排序）。
+    """
+    # 规范化输入并去重，保持调用者给出的顺序
+    codes = list(dict.fromkeys(area.strip().upper() for area in areas if area.strip()))
+    if not codes:
+        return "请至少提供一个区域代码。"
+
+    states = [code for code in codes if AREA_CODE_PATTERN.match(code)]
+    zones = [code for code in codes if ZONE_CODE_PATTERN.match(code)]
+
+    limit_per_area = max(1, limit_per_area)
+    # 同类区域按批合并为一个请求，各批之间并发执行，并发数由信号量限制
+    semaphore = asyncio.Semaphore(ALERTS_MAX_CONCURRENCY)
+    batches = [("area", states[i:i + ALERTS_BATCH_SIZE]) for i in range(0, len(states), ALERTS_BATCH_SIZE)]
+    batches += [("zone", zones[i:i + ALERTS_BATCH_SIZE]) for i in range(0, len(zones), ALERTS_BATCH_SIZE)]
+    results: dict[str, dict[str, Any] | None] = {}
+    fetches = (fetch_alerts_batch(param, batch, semaphore, limit_per_area) for param, batch in batches)
+    for batch in await asyncio.gather(*fetches):
+        results.update(batch)
+
+    # 按输入顺序输出每个区域的结果，单个区域失败不影响其他区域
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        sections = []
+        for code in codes:
+            if code not in results:
+                body = "无效的区域代码。"
+            elif results[code] is None:
+                body = "无法获取预警信息或未找到相关数据。"
+            elif not results[code]["features"]:
+                body = "当前没有生效的天气预警。"
+            else:
+                shown = results[code]["features"]
+                body = "\n---\n".join(format_alert(feature) for feature in shown)
+                if results[code]["total"] > len(shown):
+                    body += f"\n---\n共 {results[code]['total']} 条预警，仅显示最重要的 {len(shown)} 条。"
+            sections.append(f"=== {code} ===\n{body}")
+    return "\n\n".join(sections)
+
+
+# --- MCP 资源定义 ---
+
+@mcp.resource("weather://cache/stats")
+def cache_stats() -> dict[str, int]:
+    """HTTP 响应缓存的统计信息：条目数、命中、未命中与重新验证次数。"""
+    return response_cache.stats()
 
-    # 将格式化后的预报信息连接成一个字符串并返回
-    return "\n---\n".join(forecasts)
+
+@mcp.resource("weather://metrics")
+def metrics_snapshot() -> dict[str, Any]:
+    """工具与上游请求的耗时分布（p50/p95/p99）、进行中的请求数、错误数和缓存命中率。"""
+    return metrics.snapshot()
+
+
+@mcp.resource("weather://metrics/prometheus", mime_type="text/plain")
+def metrics_prometheus() -> str:
+    """Prometheus 文本格式的全部指标。"""
+    return metrics.render_prometheus()
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """网络模式下的 /metrics 路由，供 Prometheus 直接抓取。"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 
 # --- 服务器启动 ---
 
+def create_http_app(transport: str) -> Starlette:
+    """
+    构建网络传输模式下的 ASGI 应用（streamable-http 或 sse）。
+
+    一个长期运行的进程同时服务多个 MCP 客户端，所有客户端共享同一个上游连接池和缓存；
+    进程退出时在应用的生命周期中统一释放这些资源。
+    """
+    global _network_mode
+    _network_mode = True
+    app = mcp.streamable_http_app() if transport == "streamable-http" else mcp.sse_app()
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"])
+    inner_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def app_lifespan(app: Starlette) -> AsyncIterator[None]:
+        async with inner_lifespan(app):
+            try:
+                yield
+            finally:
+                await release_shared_resources()
+
+    app.router.lifespan_context = app_lifespan
+    return app
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="NWS 天气 MCP 服务器")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http", "sse"],
+                        default=os.getenv("WEATHER_MCP_TRANSPORT", "stdio"))
+    parser.add_argument("--host", default=os.getenv("WEATHER_MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEATHER_MCP_PORT", "8000")))
+    # 同时处理的 HTTP 请求上限，超出的请求直接返回 503，防止过载时排队无限增长
+    parser.add_argument("--max-concurrency", type=int,
+                        default=int(os.getenv("WEATHER_MCP_MAX_CONCURRENCY", "256")))
+    # 无状态模式：每个请求独立处理，不在服务端保存会话，适合大量短连接客户端
+    parser.add_argument("--stateless", action="store_true",
+                        default=os.getenv("WEATHER_MCP_STATELESS", "0") == "1")
+    return parser.parse_args()
+
+
 # 这是一个标准的 Python 入口点检查
 # 确保只有当这个文件被直接运行时，以下代码才会被执行
 if __name__ == "__main__":
-    # 初始化并运行 MCP 服务器
-    # transport='stdio' 表示服务器将通过标准输入/输出(stdin/stdout)与客户端（如大模型）进行通信。
-    # 这是与本地模型或调试工具交互的常见方式。
-    mcp.run(transport='stdio')
+    args = parse_args()
+    if args.transport == "stdio":
+        # 初始化并运行 MCP 服务器
+        # transport='stdio' 表示服务器将通过标准输入/输出(stdin/stdout)与客户端（如大模型）进行通信。
+        # 这是与本地模型或调试工具交互的常见方式。
+        mcp.run(transport='stdio')
+    else:
+        # 网络模式：一个进程通过 HTTP 同时服务多个客户端，共享连接池和缓存
+        mcp.settings.stateless_http = args.stateless
+        uvicorn.run(
+            create_http_app(args.transport),
+            host=args.host,
+            port=args.port,
+            limit_concurrency=args.max_concurrency,
+            log_level=mcp.settings.log_level.lower(),
+        )
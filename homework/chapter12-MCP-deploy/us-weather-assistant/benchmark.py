@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the US Weather Assistant MCP Server
+
+Starts the local OpenWeatherMap mock (mock_openweather.py), then drives the
+MCP server with N concurrent client sessions issuing a mix of tool calls.
+Reports throughput, p50/p95/p99 latency and how many requests actually
+reached the upstream API, so cache and coalescing changes can be measured
+without an API key or network access.
+
+    python benchmark.py --clients 20 --requests 25 --latency-ms 80
+    python benchmark.py --transport stdio --clients 4 --requests 10
+
+With ``--max-p95-ms`` / ``--max-upstream-calls`` / ``--max-errors`` the
+script exits non-zero when a threshold is exceeded, for use in CI.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from mock_openweather import MockOpenWeather
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_server")
+sys.path.insert(0, SERVER_DIR)
+
+CITIES = [
+    ("Seattle", "WA"), ("Portland", "OR"), ("San Francisco", "CA"), ("Los Angeles", "CA"),
+    ("Denver", "CO"), ("Phoenix", "AZ"), ("Austin", "TX"), ("Chicago", "IL"),
+    ("Miami", "FL"), ("Atlanta", "GA"), ("Boston", "MA"), ("New York", "NY"),
+    ("Nashville", "TN"), ("Minneapolis", "MN"), ("Salt Lake City", "UT"), ("New Orleans", "LA"),
+]
+
+# Relative weights of the tool calls each client issues
+TOOL_MIX = [("get_current_weather", 6), ("get_weather_forecast", 3), ("get_current_weather_bulk", 1)]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def make_call(rng: random.Random, cities: List[Tuple[str, str]]) -> Tuple[str, Dict[str, Any]]:
+    """Pick the next tool call from the weighted mix"""
+    tool = rng.choices([name for name, _ in TOOL_MIX], weights=[weight for _, weight in TOOL_MIX])[0]
+    if tool == "get_current_weather_bulk":
+        picks = rng.sample(cities, min(3, len(cities)))
+        return tool, {"cities": [{"city": city, "state": state} for city, state in picks]}
+    city, state = rng.choice(cities)
+    arguments = {"city": city, "state": state}
+    if tool == "get_weather_forecast":
+        arguments["days"] = rng.randint(1, 5)
+    return tool, arguments
+
+
+async def run_session(session, args: argparse.Namespace, seed: int, results: List[Tuple[str, float, bool]]):
+    """Issue ``args.requests`` sequential tool calls over one client session"""
+    rng = random.Random(seed)
+    cities = CITIES[:args.cities]
+    for _ in range(args.requests):
+        tool, arguments = make_call(rng, cities)
+        start = time.perf_counter()
+        try:
+            result = await session.call_tool(tool, arguments)
+            text = result.content[0].text if result.content else ""
+            ok = not result.isError and not text.startswith("Error")
+        except Exception:
+            ok = False
+        results.append((tool, time.perf_counter() - start, ok))
+
+
+async def run_memory_clients(args: argparse.Namespace, base_url: str, results: List[Tuple[str, float, bool]]):
+    """Run every client against the server in this process over in-memory streams"""
+    from mcp.shared.memory import create_connected_server_and_client_session
+    import weather
+    from rate_limiter import RateLimiter
+
+    weather.OPENWEATHER_API_KEY = "benchmark"
+    weather.OPENWEATHER_BASE_URL = base_url
+    # Start from a cold service so cache effects are measured from zero
+    if weather.weather_service is not None:
+        await weather.weather_service.close()
+    weather.weather_service = weather.WeatherService("benchmark")
+    weather.weather_service.rate_limiter = RateLimiter(
+        rate=args.rate_limit_per_minute / 60,
+        burst=weather.RATE_LIMIT_BURST,
+        max_queue=weather.RATE_LIMIT_MAX_QUEUE,
+    )
+
+    async def client(i: int):
+        async with create_connected_server_and_client_session(weather.server) as session:
+            await run_session(session, args, args.seed + i, results)
+
+    try:
+        await asyncio.gather(*(client(i) for i in range(args.clients)))
+    finally:
+        await weather.weather_service.close()
+        weather.weather_service = None
+
+
+async def run_stdio_clients(args: argparse.Namespace, base_url: str, results: List[Tuple[str, float, bool]]):
+    """Run each client against its own server subprocess over stdio"""
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=[os.path.join(SERVER_DIR, "weather.py")],
+        env={
+            **os.environ,
+            "OPENWEATHER_API_KEY": "benchmark",
+            "OPENWEATHER_BASE_URL": base_url,
+            "WEATHER_RATE_LIMIT_PER_MINUTE": str(args.rate_limit_per_minute),
+        },
+    )
+
+    async def client(i: int):
+        async with stdio_client(params) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                await run_session(session, args, args.seed + i, results)
+
+    await asyncio.gather(*(client(i) for i in range(args.clients)))
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the benchmark and return a report dictionary"""
+    results: List[Tuple[str, float, bool]] = []
+    async with MockOpenWeather(
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    ) as mock:
+        start = time.perf_counter()
+        if args.transport == "stdio":
+            await run_stdio_clients(args, mock.base_url, results)
+        else:
+            await run_memory_clients(args, mock.base_url, results)
+        elapsed = time.perf_counter() - start
+        upstream = dict(mock.calls)
+
+    latencies = sorted(latency for _, latency, _ in results)
+    per_tool = {}
+    for tool, _ in TOOL_MIX:
+        tool_latencies = sorted(latency for name, latency, _ in results if name == tool)
+        if tool_latencies:
+            per_tool[tool] = {
+                "calls": len(tool_latencies),
+                "p50_ms": percentile(tool_latencies, 50) * 1000,
+                "p95_ms": percentile(tool_latencies, 95) * 1000,
+            }
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "elapsed": elapsed,
+        "rps": len(results) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "per_tool": per_tool,
+        "upstream": upstream,
+        "upstream_calls": sum(upstream.get(endpoint, 0) for endpoint in ("weather", "forecast", "group")),
+    }
+
+
+def print_report(report: Dict[str, Any], args: argparse.Namespace):
+    print(f"Transport: {args.transport}, clients: {args.clients}, requests per client: {args.requests}")
+    print(f"Completed {report['requests']} calls in {report['elapsed']:.2f}s ({report['rps']:.1f} req/s), "
+          f"{report['errors']} errors")
+    print(f"Latency (ms): p50 {report['p50_ms']:.1f}, p95 {report['p95_ms']:.1f}, p99 {report['p99_ms']:.1f}")
+    for tool, stats in report["per_tool"].items():
+        print(f"  {tool}: {stats['calls']} calls, p50 {stats['p50_ms']:.1f}, p95 {stats['p95_ms']:.1f}")
+    print(f"Upstream calls: {report['upstream_calls']} {report['upstream']}")
+
+
+def check_thresholds(report: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """Return a message for every threshold the report exceeds"""
+    failures = []
+    if args.max_p95_ms is not None and report["p95_ms"] > args.max_p95_ms:
+        failures.append(f"p95 {report['p95_ms']:.1f}ms exceeds {args.max_p95_ms}ms")
+    if args.max_upstream_calls is not None and report["upstream_calls"] > args.max_upstream_calls:
+        failures.append(f"{report['upstream_calls']} upstream calls exceeds {args.max_upstream_calls}")
+    if args.max_errors is not None and report["errors"] > args.max_errors:
+        failures.append(f"{report['errors']} errors exceeds {args.max_errors}")
+    return failures
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the weather MCP server against a local OpenWeatherMap mock")
+    parser.add_argument("--transport", choices=["memory", "stdio"], default="memory",
+                        help="memory: in-process sessions; stdio: one server subprocess per client")
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent client sessions")
+    parser.add_argument("--requests", type=int, default=20, help="Tool calls per client")
+    parser.add_argument("--cities", type=int, default=len(CITIES), help="Number of distinct cities to query")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream 500s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of upstream 429s")
+    parser.add_argument("--rate-limit-per-minute", type=float, default=6000,
+                        help="Client-side rate limit applied by the server during the run")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-upstream-calls", type=int, default=None)
+    parser.add_argument("--max-errors", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print_report(report, args)
+    failures = check_thresholds(report, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
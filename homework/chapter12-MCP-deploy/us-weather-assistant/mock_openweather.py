@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Local OpenWeatherMap stand-in for offline testing and benchmarking
+
+Serves realistic /weather, /forecast and /group payloads under
+/data/2.5/, with optional injected latency, server errors and 429
+responses. Per-endpoint request counts are available at /stats.
+
+Run standalone:
+
+    python mock_openweather.py --port 8081 --latency-ms 50 --throttle-rate 0.05
+
+and point the server at it with OPENWEATHER_BASE_URL=http://127.0.0.1:8081/data/2.5
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+CONDITIONS = ["clear sky", "few clouds", "scattered clouds", "light rain", "overcast clouds", "mist"]
+
+
+def _city_from_request(request: web.Request) -> Dict[str, Any]:
+    """Derive a stable fake city from an ``id`` or ``q`` query parameter"""
+    if "id" in request.query:
+        city_id = int(request.query["id"])
+        name = f"City {city_id}"
+    else:
+        name = request.query.get("q", "Unknown").split(",")[0].strip().title()
+        city_id = zlib.crc32(name.lower().encode()) % 10_000_000
+    return {"id": city_id, "name": name}
+
+
+def _current(city: Dict[str, Any], now: int) -> Dict[str, Any]:
+    rng = random.Random(city["id"])
+    temp = round(rng.uniform(20, 95), 2)
+    return {
+        "id": city["id"],
+        "name": city["name"],
+        "dt": now,
+        "timezone": -18000,
+        "coord": {"lat": round(rng.uniform(25, 49), 4), "lon": round(rng.uniform(-124, -67), 4)},
+        "sys": {"country": "US"},
+        "main": {
+            "temp": temp,
+            "feels_like": round(temp + rng.uniform(-4, 4), 2),
+            "temp_min": round(temp - 3, 2),
+            "temp_max": round(temp + 3, 2),
+            "humidity": rng.randint(15, 95),
+            "pressure": rng.randint(995, 1030),
+        },
+        "weather": [{"description": rng.choice(CONDITIONS)}],
+        "wind": {"speed": round(rng.uniform(0, 25), 2)},
+    }
+
+
+def _forecast(city: Dict[str, Any], now: int, count: int) -> Dict[str, Any]:
+    rng = random.Random(city["id"])
+    start = now - now % 10800 + 10800
+    entries = []
+    for i in range(count):
+        dt = start + i * 10800
+        temp = round(rng.uniform(30, 90), 2)
+        entries.append({
+            "dt": dt,
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+            "main": {
+                "temp": temp,
+                "temp_min": round(temp - 2, 2),
+                "temp_max": round(temp + 2, 2),
+                "humidity": rng.randint(15, 95),
+            },
+            "weather": [{"description": rng.choice(CONDITIONS)}],
+            "pop": round(rng.random(), 2),
+        })
+    return {
+        "cnt": count,
+        "list": entries,
+        "city": {"id": city["id"], "name": city["name"], "country": "US", "timezone": -18000},
+    }
+
+
+class MockOpenWeather:
+    """In-process mock OpenWeatherMap server with fault injection"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.calls: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/data/2.5/weather", self._weather)
+        self.app.router.add_get("/data/2.5/forecast", self._forecast)
+        self.app.router.add_get("/data/2.5/group", self._group)
+        self.app.router.add_get("/stats", self._stats)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/data/2.5"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when an ephemeral one (0) was requested
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def _inject_faults(self, endpoint: str, request: web.Request) -> Optional[web.Response]:
+        """Apply latency and return an error response if one is injected"""
+        self.calls[endpoint] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self._rng.expovariate(1 / self.latency_ms) / 1000)
+        if "appid" not in request.query:
+            return web.json_response({"cod": 401, "message": "Invalid API key"}, status=401)
+        roll = self._rng.random()
+        if roll < self.throttle_rate:
+            self.calls["429"] += 1
+            return web.json_response(
+                {"cod": 429, "message": "Your account is temporary blocked due to exceeding of requests limitation"},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            self.calls["500"] += 1
+            return web.json_response({"cod": 500, "message": "Internal error"}, status=500)
+        return None
+
+    async def _weather(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults("weather", request)
+        if error is not None:
+            return error
+        return web.json_response(_current(_city_from_request(request), int(time.time())))
+
+    async def _forecast(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults("forecast", request)
+        if error is not None:
+            return error
+        count = min(int(request.query.get("cnt", 40)), 40)
+        return web.json_response(_forecast(_city_from_request(request), int(time.time()), count))
+
+    async def _group(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults("group", request)
+        if error is not None:
+            return error
+        ids = [int(city_id) for city_id in request.query.get("id", "").split(",") if city_id]
+        if len(ids) > 20:
+            return web.json_response({"cod": "400", "message": "Too many city IDs (max 20)"}, status=400)
+        now = int(time.time())
+        cities = [_current({"id": city_id, "name": f"City {city_id}"}, now) for city_id in ids]
+        return web.json_response({"cnt": len(cities), "list": cities})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.calls))
+
+
+async def _serve(args: argparse.Namespace):
+    mock = MockOpenWeather(args.host, args.port, args.latency_ms, args.error_rate, args.throttle_rate)
+    await mock.start()
+    print(f"Mock OpenWeatherMap listening on {mock.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mock.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenWeatherMap stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean injected latency in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
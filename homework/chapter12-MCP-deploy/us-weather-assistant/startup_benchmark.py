@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the US Weather Assistant MCP Server
+
+MCP clients such as Cline spawn the server as a new stdio process for each
+session, so start-up time adds to the latency of every conversation. This
+script spawns ``weather_server/weather.py`` the same way a client does,
+sends initialize, initialized and tools/list, and measures the time from
+process spawn to the tools/list reply.
+
+    python startup_benchmark.py --runs 10
+    python startup_benchmark.py --runs 5 --budget-ms 1500
+
+With ``--budget-ms`` the script exits non-zero when the median exceeds it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_server", "weather.py")
+
+_REQUESTS = [
+    {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "startup-benchmark", "version": "1.0.0"},
+        },
+    },
+    {"jsonrpc": "2.0", "method": "notifications/initialized"},
+    {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+]
+
+
+def measure_once(python: str = sys.executable, server_path: str = SERVER_PATH) -> float:
+    """Spawn the server and return seconds until its tools/list reply arrives"""
+    env = {**os.environ, "OPENWEATHER_API_KEY": os.environ.get("OPENWEATHER_API_KEY", "startup-benchmark")}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [python, server_path],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        text=True,
+    )
+    try:
+        # Clients send these without waiting; the server reads them as soon as it is up
+        process.stdin.write("".join(json.dumps(request) + "\n" for request in _REQUESTS))
+        process.stdin.flush()
+        for line in process.stdout:
+            message = json.loads(line)
+            if message.get("id") == 2:
+                if "result" not in message or not message["result"].get("tools"):
+                    raise RuntimeError(f"Unexpected tools/list reply: {message}")
+                return time.perf_counter() - start
+        raise RuntimeError("Server exited before replying to tools/list")
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_startup_benchmark(runs: int) -> Dict[str, float]:
+    """Measure ``runs`` cold starts and return min/median/max in milliseconds"""
+    samples: List[float] = sorted(measure_once() * 1000 for _ in range(runs))
+    return {"runs": runs, "min_ms": samples[0], "median_ms": statistics.median(samples), "max_ms": samples[-1]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time to the first tools/list reply from a fresh server process")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when the median exceeds this")
+    args = parser.parse_args()
+
+    report = run_startup_benchmark(args.runs)
+    print(f"Time to first tools/list over {report['runs']} runs: "
+          f"min {report['min_ms']:.0f}ms, median {report['median_ms']:.0f}ms, max {report['max_ms']:.0f}ms")
+    if args.budget_ms is not None and report["median_ms"] > args.budget_ms:
+        print(f"FAIL: median {report['median_ms']:.0f}ms exceeds budget {args.budget_ms:.0f}ms")
+        sys.exit(1)
@@ -9,6 +9,7 @@ an actual API key or network connection.
 import sys
 import os
 import asyncio
+import json
 from unittest.mock import Mock, patch, AsyncMock
 
 # Add the weather_server directory to the path
@@ -46,6 +47,485 @@ def test_weather_service():
         print(f"❌ Failed to instantiate WeatherService: {e}")
         return False
 
+def test_shared_weather_service():
+    """Test that one pooled WeatherService session is reused across calls"""
+    try:
+        import weather
+        
+        async def check():
+            service = weather.get_weather_service()
+            assert service is weather.get_weather_service()
+            session = await service.start()
+            assert session is await service.start()
+            assert session.connector.limit_per_host == service.limit_per_host
+            await service.close()
+            assert session.closed
+        
+        asyncio.run(check())
+        print("✅ WeatherService session is shared and closes cleanly")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test shared WeatherService: {e}")
+        return False
+
+def test_city_index():
+    """Test building and querying the offline city index"""
+    try:
+        import json
+        import tempfile
+        import city_index
+        
+        cities = [
+            {"id": 5391959, "name": "San Francisco", "state": "CA", "country": "US", "coord": {"lat": 37.7749, "lon": -122.4194}},
+            {"id": 4407066, "name": "St. Louis", "state": "MO", "country": "US", "coord": {"lat": 38.6273, "lon": -90.1979}},
+            {"id": 5128581, "name": "New York City", "state": "NY", "country": "US", "coord": {"lat": 40.7143, "lon": -74.006}},
+            {"id": 4164138, "name": "Miami", "state": "FL", "country": "US", "coord": {"lat": 25.7743, "lon": -80.1937}},
+            {"id": 4275586, "name": "Miami", "state": "OK", "country": "US", "coord": {"lat": 36.8745, "lon": -94.8775}},
+            {"id": 2643743, "name": "London", "country": "GB", "coord": {"lat": 51.5085, "lon": -0.1257}},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "city.list.json")
+            target = os.path.join(tmp, "us_cities.idx")
+            with open(source, "w") as f:
+                json.dump(cities, f)
+            
+            assert city_index.build_index(source, target) == 5
+            index = city_index.CityIndex(target)
+            assert index.lookup("san francisco", "ca").id == 5391959
+            assert index.lookup("Saint Louis", "MO").id == 4407066
+            assert index.lookup("NYC").id == 5128581
+            assert index.lookup("N.Y.C.").id == 5128581
+            assert city_index.normalize_city("Washington, D.C.") == "washington dc"
+            assert index.lookup("Miami") is None  # ambiguous without a state
+            assert index.lookup("Miami", "FL").id == 4164138
+            assert [c.state for c in index.search("mia")] == ["FL", "OK"]
+            assert index.lookup("London") is None
+            index.close()
+        
+        print("✅ City index builds and resolves names, aliases and prefixes")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test city index: {e}")
+        return False
+
+def test_bulk_weather():
+    """Test that bulk lookups are chunked into group requests of at most 20 IDs"""
+    try:
+        import weather
+        from city_index import CityRecord
+        
+        service = weather.WeatherService("test_api_key")
+        service.resolve_city = lambda city, state=None: CityRecord(int(city[4:]), city, state, 0.0, 0.0)
+        
+        async def fake_group(city_ids):
+            return {"list": [{
+                "id": city_id,
+                "name": f"City {city_id}",
+                "main": {"temp": 70, "feels_like": 71, "humidity": 50},
+                "weather": [{"description": "clear sky"}]
+            } for city_id in city_ids]}
+        
+        service._get_group = AsyncMock(side_effect=fake_group)
+        cities = [{"city": f"city{i}", "state": "CA"} for i in range(45)]
+        result = asyncio.run(weather.get_bulk_weather(service, cities))
+        
+        chunk_sizes = sorted(len(call.args[0]) for call in service._get_group.call_args_list)
+        assert chunk_sizes == [5, 20, 20], chunk_sizes
+        assert result.startswith("Current Weather for 45 of 45 cities")
+        
+        async def check_cache():
+            service._get_group.reset_mock()
+            # Fresh entries are cache hits; concurrent calls for new IDs share one group request
+            first, second = await asyncio.gather(
+                service.get_current_weather_group([1, 2, 100]),
+                service.get_current_weather_group([100, 101]),
+            )
+            assert first[1]["id"] == 1 and first[100] is second[100]
+            assert [sorted(call.args[0]) for call in service._get_group.call_args_list] == [[100, 101]]
+            # Stale entries are served immediately and refreshed in the background
+            service.cache.peek(service._cache_key("weather", {"id": 1})).fresh_until = 0
+            before = service.cache.stats()
+            assert (await service.get_current_weather_group([1]))[1]["id"] == 1
+            await asyncio.sleep(0.01)
+            assert service.cache.stats()["stale_hits"] == before["stale_hits"] + 1
+            assert service._get_group.call_args_list[-1].args[0] == [1]
+            await service.close()
+        
+        asyncio.run(check_cache())
+        print("✅ Bulk weather requests are chunked, combined and cached")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test bulk weather: {e}")
+        return False
+
+def test_weather_cache():
+    """Test that repeated lookups are cached and stale entries refresh in the background"""
+    try:
+        import weather
+        
+        async def check():
+            service = weather.WeatherService("test_api_key")
+            service.resolve_city = lambda city, state=None: None
+            service._request = AsyncMock(side_effect=[{"name": "Old"}, {"name": "New"}])
+            
+            assert (await service.get_current_weather("Austin", "TX"))["name"] == "Old"
+            assert (await service.get_current_weather("Austin", "TX"))["name"] == "Old"
+            assert service._request.call_count == 1
+            
+            # Expire the entry: the stale value is served while a refresh runs
+            for entry in service.cache._entries.values():
+                entry.fresh_until = 0
+            assert (await service.get_current_weather("Austin", "TX"))["name"] == "Old"
+            await asyncio.sleep(0)
+            assert (await service.get_current_weather("Austin", "TX"))["name"] == "New"
+            
+            stats = service.cache.stats()
+            assert (stats["hits"], stats["stale_hits"], stats["misses"]) == (2, 1, 1), stats
+            await service.close()
+        
+        asyncio.run(check())
+        print("✅ Weather cache serves hits and refreshes stale entries")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test weather cache: {e}")
+        return False
+
+def test_forecast_aggregation():
+    """Test daily forecast aggregation groups by local date and computes stats"""
+    try:
+        import weather
+        
+        def entry(dt, temp, humidity, pop, description):
+            return {
+                "dt": dt,
+                "main": {"temp": temp, "temp_max": temp + 1, "temp_min": temp - 1, "humidity": humidity},
+                "weather": [{"description": description}],
+                "pop": pop
+            }
+        
+        # 2024-01-15 06:00 UTC is still 2024-01-14 in Los Angeles (UTC-8)
+        forecast_data = {
+            "city": {"name": "Los Angeles", "country": "US", "timezone": -28800},
+            "list": [
+                entry(1705298400, 50, 80, 0.1, "mist"),
+                entry(1705320000, 60, 60, 0.0, "clear sky"),
+                entry(1705341600, 70, 40, 0.6, "few clouds"),
+                entry(1705363200, 64, 50, 0.2, "light rain"),
+            ]
+        }
+        summary = weather.aggregate_forecast(forecast_data)
+        
+        assert [day["date"] for day in summary["days"]] == ["2024-01-14", "2024-01-15"]
+        day = summary["days"][1]
+        assert (day["high"], day["low"], day["mean"]) == (71, 59, 64.7), day
+        assert (day["humidity"], day["precipitation_probability"]) == (50, 60), day
+        assert day["conditions"] == "Few Clouds"
+        
+        # Days are trimmed after grouping by local date, not by raw entry count
+        one_day = weather.aggregate_forecast(forecast_data, max_days=1)
+        assert [day["date"] for day in one_day["days"]] == ["2024-01-14"]
+        assert weather.format_forecast(forecast_data, max_days=1).count("📅") == 1
+        print("✅ Forecast aggregation groups by local day in one pass")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test forecast aggregation: {e}")
+        return False
+
+def test_rate_limiter():
+    """Test token bucket pacing, priority ordering, fail-fast and 429 backoff"""
+    try:
+        from rate_limiter import PRIORITY_BULK, PRIORITY_INTERACTIVE, RateLimiter, RateLimitExceeded
+        
+        async def check():
+            limiter = RateLimiter(rate=50, burst=1)
+            await limiter.acquire()  # uses the burst token
+            
+            # Queued interactive calls are served before bulk calls that queued earlier
+            order = []
+            async def worker(name, priority):
+                await limiter.acquire(priority, timeout=1)
+                order.append(name)
+            await asyncio.gather(worker("bulk", PRIORITY_BULK), worker("interactive", PRIORITY_INTERACTIVE))
+            assert order == ["interactive", "bulk"], order
+            
+            # Fail fast with a retry-after hint when the wait exceeds the deadline
+            try:
+                await limiter.acquire(timeout=0)
+                raise AssertionError("expected RateLimitExceeded")
+            except RateLimitExceeded as e:
+                assert e.retry_after > 0
+            
+            # A 429 halves the rate and pauses for Retry-After
+            assert limiter.record_throttled(0.05) == 0.05
+            assert limiter.rate == 25
+        
+        async def check_abandoned_waiters():
+            limiter = RateLimiter(rate=20, burst=1)
+            await limiter.acquire()
+            
+            # A bulk call that times out behind interactive ones leaves the queue at once
+            bulk = asyncio.create_task(limiter.acquire(PRIORITY_BULK, timeout=0.06))
+            await asyncio.sleep(0)
+            interactive = [asyncio.create_task(limiter.acquire(timeout=1)) for _ in range(2)]
+            await asyncio.sleep(0.08)
+            try:
+                await bulk
+                raise AssertionError("expected RateLimitExceeded")
+            except RateLimitExceeded:
+                pass
+            assert limiter.queue_depth == 1, limiter.queue_depth
+            await asyncio.gather(*interactive)
+            
+            # A cancelled waiter is removed, so the fast path works again once a token is free
+            waiter = asyncio.create_task(limiter.acquire(timeout=1))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            assert limiter.queue_depth == 0
+            await asyncio.sleep(0.06)
+            await limiter.acquire(timeout=0)
+            
+            # A token granted to a caller cancelled before it resumed is given back
+            waiter = asyncio.create_task(limiter.acquire(timeout=1))
+            await asyncio.sleep(0)
+            limiter._tokens = 1.0
+            limiter._dispatch()
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert waiter.cancelled()
+            await limiter.acquire(timeout=0)
+        
+        asyncio.run(check())
+        asyncio.run(check_abandoned_waiters())
+        print("✅ Rate limiter paces, prioritizes, backs off and drops abandoned waiters")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test rate limiter: {e}")
+        return False
+
+def test_tool_dispatch():
+    """Test registry dispatch rejects bad arguments before any upstream call"""
+    try:
+        import weather
+        
+        async def check():
+            service = weather.get_weather_service()
+            with patch.object(weather, "OPENWEATHER_API_KEY", "test_api_key"), \
+                    patch.object(service, "get_forecast", AsyncMock()) as get_forecast:
+                result = await weather.handle_call_tool("get_weather_forecast", {"city": "Miami", "days": 9})
+                assert "Invalid arguments" in result[0].text, result[0].text
+                result = await weather.handle_call_tool("get_current_weather", {})
+                assert "'city' is a required property" in result[0].text, result[0].text
+                result = await weather.handle_call_tool("no_such_tool", {})
+                assert "Unknown tool" in result[0].text
+                assert get_forecast.await_count == 0
+            
+            assert await weather.handle_list_tools() is await weather.handle_list_tools()
+        
+        asyncio.run(check())
+        print("✅ Tool registry validates arguments and dispatches by name")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test tool dispatch: {e}")
+        return False
+
+def test_metrics():
+    """Test metrics are recorded per tool and exposed as MCP resources"""
+    try:
+        import weather
+        from metrics import Histogram, Metrics
+        
+        hist = Histogram(buckets=(0.01, 0.1, 1.0))
+        for value in [0.005] * 90 + [0.5] * 10:
+            hist.observe(value)
+        assert hist.quantile(0.5) <= 0.01 and 0.1 < hist.quantile(0.95) <= 1.0
+        
+        registry = Metrics("test")
+        try:
+            with registry.track("tool", tool="demo"):
+                raise TimeoutError()
+        except TimeoutError:
+            pass
+        text = registry.render_prometheus()
+        assert 'test_errors_total{scope="tool",type="TimeoutError"} 1' in text, text
+        assert 'test_tool_duration_seconds_bucket{tool="demo",le="+Inf"} 1' in text, text
+        assert 'test_tool_in_flight{tool="demo"} 0' in text, text
+        
+        # A cancelled operation (e.g. a losing hedge) is not an error
+        try:
+            with registry.track("upstream", endpoint="weather"):
+                raise asyncio.CancelledError()
+        except asyncio.CancelledError:
+            pass
+        text = registry.render_prometheus()
+        assert 'test_cancelled_total{scope="upstream"} 1' in text, text
+        assert 'type="CancelledError"' not in text, text
+        assert registry.histogram("upstream_duration_seconds", endpoint="weather") is None
+        
+        async def check():
+            service = weather.get_weather_service()
+            weather_data = {"name": "Miami", "sys": {"country": "US"}, "main": {"temp": 80, "feels_like": 82, "humidity": 70, "pressure": 1012}, "weather": [{"description": "sunny"}], "wind": {"speed": 5}}
+            with patch.object(weather, "OPENWEATHER_API_KEY", "test_api_key"), \
+                    patch.object(service, "get_current_weather", AsyncMock(return_value=weather_data)):
+                await weather.handle_call_tool("get_current_weather", {"city": "Miami"})
+            resources = await weather.handle_list_resources()
+            assert {str(resource.uri) for resource in resources} == {"weather://metrics", "weather://metrics/prometheus"}
+            snapshot = json.loads((await weather.handle_read_resource("weather://metrics"))[0].content)
+            assert snapshot["histograms"]["tool_duration_seconds"]["tool=get_current_weather"]["count"] >= 1
+            assert "cache_hit_ratio" in snapshot["gauges"]
+            prometheus = (await weather.handle_read_resource("weather://metrics/prometheus"))[0].content
+            assert "# TYPE weather_assistant_tool_duration_seconds histogram" in prometheus
+        
+        asyncio.run(check())
+        print("✅ Metrics record tool latency and render as JSON and Prometheus text")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test metrics: {e}")
+        return False
+
+def test_upstream_resilience():
+    """Test the circuit breaker fails fast during an outage and hedging cuts tail latency"""
+    try:
+        import weather
+        from mock_openweather import MockOpenWeather
+        from resilience import CLOSED, OPEN, CircuitOpenError
+        
+        async def check():
+            async with MockOpenWeather(error_rate=1.0) as mock:
+                service = weather.WeatherService("test_api_key")
+                service.rate_limiter = weather.RateLimiter(rate=1000, burst=100)
+                with patch.object(weather, "OPENWEATHER_BASE_URL", mock.base_url):
+                    for _ in range(weather.BREAKER_FAILURES):
+                        try:
+                            await service._request("weather", {"q": "Miami,US"}, "Weather API error")
+                        except Exception:
+                            pass
+                    assert service.breakers["weather"].state == OPEN
+                    try:
+                        await service._request("weather", {"q": "Miami,US"}, "Weather API error")
+                        raise AssertionError("open breaker should reject requests")
+                    except CircuitOpenError:
+                        pass
+                    # Rejected while open: the mock saw only the failing requests
+                    assert mock.calls["weather"] == weather.BREAKER_FAILURES
+                    
+                    # After the cool-down one probe is let through; success closes the breaker
+                    mock.error_rate = 0.0
+                    service.breakers["weather"].opened_at -= weather.BREAKER_RESET_SECONDS
+                    await service._request("weather", {"q": "Miami,US"}, "Weather API error")
+                    assert service.breakers["weather"].state == CLOSED
+                    
+                    # Hedging: the first attempt is stuck, the duplicate answers quickly
+                    delays = iter([5.0, 0.0])
+                    original_get = service._get
+                    async def slow_then_fast(*args):
+                        await asyncio.sleep(next(delays))
+                        return await original_get(*args)
+                    policy = weather.DEFAULT_POLICY.with_overrides({"hedge": True, "hedge_delay": 0.05})
+                    with patch.dict(weather.ENDPOINT_POLICIES, {"forecast": policy}), \
+                            patch.object(service, "_get", slow_then_fast):
+                        start = asyncio.get_running_loop().time()
+                        data = await service._request("forecast", {"q": "Miami,US", "cnt": 8}, "Forecast API error")
+                        assert data["cnt"] == 8 and asyncio.get_running_loop().time() - start < 1.0
+                await service.close()
+        
+        asyncio.run(check())
+        print("✅ Circuit breaker fails fast and hedged requests avoid a stuck upstream call")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test upstream resilience: {e}")
+        return False
+
+def test_prefetch():
+    """Test hot locations are refreshed in the background before they expire"""
+    try:
+        import time
+        import weather
+        from mock_openweather import MockOpenWeather
+        from prefetch import AccessTracker
+        
+        tracker = AccessTracker(half_life=60)
+        for key, hits in (("a", 3), ("b", 1), ("c", 2)):
+            for _ in range(hits):
+                tracker.record(key, AsyncMock())
+        assert [key for key, _ in tracker.hottest(2)] == ["a", "c"]
+        
+        async def check():
+            async with MockOpenWeather() as mock:
+                service = weather.WeatherService("test_api_key")
+                service.rate_limiter = weather.RateLimiter(rate=1000, burst=100)
+                with patch.object(weather, "OPENWEATHER_BASE_URL", mock.base_url):
+                    for city in ["Miami", "Miami", "Miami", "Boston"]:
+                        await service.get_current_weather(city)
+                    assert mock.calls["weather"] == 2
+                    
+                    # Both entries are about to expire; only the hottest one fits in top-K
+                    for key in list(service.cache._entries):
+                        service.cache._entries[key].fresh_until = time.monotonic() + 1
+                    service.prefetcher.top_k = 1
+                    assert await service.prefetcher.run_once() == 1
+                    assert mock.calls["weather"] == 3
+                    miami = service.cache.peek(service._cache_key("weather", service.location_params("Miami")))
+                    assert miami.fresh_until > time.monotonic() + weather.CACHE_CURRENT_TTL - 5
+                    
+                    # Nothing is due any more, so the next cycle sends no requests
+                    assert await service.prefetcher.run_once() == 0
+                await service.close()
+        
+        asyncio.run(check())
+        print("✅ Prefetcher refreshes the hottest locations before expiry")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to test prefetch: {e}")
+        return False
+
+def test_offline_benchmark():
+    """Test the benchmark runs end to end against the local OpenWeatherMap mock"""
+    try:
+        import benchmark
+        
+        args = benchmark.parse_args(["--clients", "4", "--requests", "5", "--cities", "3", "--latency-ms", "5"])
+        report = asyncio.run(benchmark.run_benchmark(args))
+        assert report["requests"] == 20 and report["errors"] == 0, report
+        # Repeated cities across sessions must be served from the shared cache
+        assert 0 < report["upstream_calls"] < report["requests"], report
+        assert not benchmark.check_thresholds(report, args)
+        print(f"✅ Benchmark: {report['rps']:.0f} req/s, p95 {report['p95_ms']:.1f}ms, "
+              f"{report['upstream_calls']} upstream calls for {report['requests']} tool calls")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to run offline benchmark: {e}")
+        return False
+
+def test_cold_start():
+    """Test the server defers heavy work until first use and starts within budget"""
+    try:
+        import subprocess
+        import startup_benchmark
+        
+        # A fresh interpreter, since this process has already imported aiohttp
+        # Some MCP SDK versions import jsonschema themselves; only check it when the SDK does not
+        probe = ("import sys, mcp.server.lowlevel, mcp.server.stdio; "
+                 "sdk_jsonschema = 'jsonschema' in sys.modules; "
+                 "import weather; "
+                 "assert 'aiohttp' not in sys.modules, 'aiohttp imported at startup'; "
+                 "assert sdk_jsonschema or 'jsonschema' not in sys.modules, 'jsonschema imported at startup'; "
+                 "assert all(tool._validator is None for tool in weather.TOOLS.values()), 'validators compiled at import'")
+        subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(startup_benchmark.SERVER_PATH),
+                       check=True, capture_output=True, text=True)
+        
+        # Generous budget: this guards against regressions such as a new eager import, not machine speed
+        report = startup_benchmark.run_startup_benchmark(runs=3)
+        assert report["median_ms"] < 3000, report
+        print(f"✅ Cold start to first list_tools: median {report['median_ms']:.0f}ms")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Failed to test cold start: {e.stderr.strip().splitlines()[-1]}")
+        return False
+    except Exception as e:
+        print(f"❌ Failed to test cold start: {e}")
+        return False
+
 def test_formatting_functions():
     """Test weather data formatting functions"""
     try:
@@ -115,6 +595,18 @@ def main():
         ("Import Test", test_imports),
         ("Server Creation", test_server_creation),
         ("WeatherService Class", test_weather_service),
+        ("Shared WeatherService", test_shared_weather_service),
+        ("City Index", test_city_index),
+        ("Bulk Weather", test_bulk_weather),
+        ("Weather Cache", test_weather_cache),
+        ("Forecast Aggregation", test_forecast_aggregation),
+        ("Rate Limiter", test_rate_limiter),
+        ("Tool Dispatch", test_tool_dispatch),
+        ("Metrics", test_metrics),
+        ("Upstream Resilience", test_upstream_resilience),
+        ("Prefetch", test_prefetch),
+        ("Offline Benchmark", test_offline_benchmark),
+        ("Cold Start", test_cold_start),
         ("Formatting Functions", test_formatting_functions),
     ]
     
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Offline US city index for the US Weather Assistant MCP Server
+
+Maps normalized "city, state" names to OpenWeatherMap city IDs and
+coordinates so the server can query the API by ID instead of sending
+ambiguous free-text ``q=`` lookups.
+
+The index is built once from OpenWeatherMap's bulk city list
+(http://bulk.openweathermap.org/sample/city.list.json.gz) into a compact,
+sorted binary file. At runtime the file is memory-mapped and searched in
+place with binary search, so loading costs a single ``mmap`` call no
+matter how many cities it holds.
+
+Build it with:
+
+    python weather_server/city_index.py city.list.json.gz weather_server/data/us_cities.idx
+"""
+
+import gzip
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Default location of the prebuilt index (overridable via environment variable)
+CITY_INDEX_PATH = os.getenv(
+    "WEATHER_CITY_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "us_cities.idx"),
+)
+
+# File layout: header, fixed-size records sorted by key, then a blob of UTF-8 keys.
+# Each key is "<normalized city>|<STATE>".
+_MAGIC = b"OWCI"
+_VERSION = 2  # bumped whenever normalize_city changes, so stale indexes are rebuilt
+_HEADER = struct.Struct("<4sII")  # magic, version, record count
+_RECORD = struct.Struct("<IHIff")  # key offset, key length, city id, lat, lon
+
+# Common nicknames and abbreviations, resolved before searching the index
+CITY_ALIASES: Dict[str, Tuple[str, str]] = {
+    "nyc": ("new york city", "NY"),
+    "new york": ("new york city", "NY"),
+    "la": ("los angeles", "CA"),
+    "sf": ("san francisco", "CA"),
+    "dc": ("washington", "DC"),
+    "washington dc": ("washington", "DC"),
+    "philly": ("philadelphia", "PA"),
+    "vegas": ("las vegas", "NV"),
+    "nola": ("new orleans", "LA"),
+    "slc": ("salt lake city", "UT"),
+}
+
+# Runs of single letters ("d c" from "D.C.") are joined into one word
+_INITIALS = re.compile(r"\b([a-z]) (?=[a-z]\b)")
+
+# Word-level abbreviations normalized to a single spelling on both sides
+_WORD_ABBREVIATIONS = {"st": "saint", "ste": "sainte", "ft": "fort", "mt": "mount", "pt": "point"}
+
+
+class CityRecord(NamedTuple):
+    """A resolved city entry"""
+    id: int
+    name: str  # normalized name
+    state: str
+    lat: float
+    lon: float
+
+
+def normalize_city(name: str) -> str:
+    """Normalize a city name: fold accents and case, drop punctuation, join initials, expand abbreviations"""
+    folded = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    words = _INITIALS.sub(r"\1", " ".join(re.sub(r"[^a-z0-9]+", " ", folded).split())).split()
+    return " ".join(_WORD_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _make_key(city: str, state: Optional[str]) -> str:
+    return f"{normalize_city(city)}|{(state or '').strip().upper()}"
+
+
+def build_index(source_path: str, output_path: str) -> int:
+    """Build a binary index of US cities from OpenWeatherMap's city list (.json or .json.gz)
+
+    Returns the number of cities written.
+    """
+    opener = gzip.open if source_path.endswith(".gz") else open
+    with opener(source_path, "rt", encoding="utf-8") as f:
+        cities = json.load(f)
+
+    # Keep one entry per (city, state); the lowest ID is usually the primary city record
+    entries: Dict[str, Tuple[int, float, float]] = {}
+    for city in cities:
+        if city.get("country") != "US" or not city.get("state"):
+            continue
+        key = _make_key(city["name"], city["state"])
+        if key.startswith("|"):
+            continue
+        if key not in entries or city["id"] < entries[key][0]:
+            entries[key] = (city["id"], city["coord"]["lat"], city["coord"]["lon"])
+
+    keys = sorted(entries)
+    blob = bytearray()
+    records = bytearray()
+    for key in keys:
+        encoded = key.encode("utf-8")
+        city_id, lat, lon = entries[key]
+        records += _RECORD.pack(len(blob), len(encoded), city_id, lat, lon)
+        blob += encoded
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(keys)))
+        f.write(records)
+        f.write(blob)
+    return len(keys)
+
+
+class CityIndex:
+    """Memory-mapped, read-only view of a prebuilt city index"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError(f"Unsupported city index file: {path}")
+        self._count = count
+        self._blob_start = _HEADER.size + count * _RECORD.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        self._mm.close()
+
+    def _key_at(self, i: int) -> str:
+        offset, length, _, _, _ = _RECORD.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)
+        start = self._blob_start + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _record_at(self, i: int) -> CityRecord:
+        offset, length, city_id, lat, lon = _RECORD.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)
+        start = self._blob_start + offset
+        name, _, state = self._mm[start:start + length].decode("utf-8").partition("|")
+        return CityRecord(city_id, name, state, round(lat, 4), round(lon, 4))
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _scan(self, prefix: str) -> Iterator[int]:
+        i = self._lower_bound(prefix)
+        while i < self._count and self._key_at(i).startswith(prefix):
+            yield i
+            i += 1
+
+    def lookup(self, city: str, state: Optional[str] = None) -> Optional[CityRecord]:
+        """Resolve a city (and optional state abbreviation) to a single record
+
+        Without a state the match is only returned when it is unambiguous.
+        """
+        name = normalize_city(city)
+        if name in CITY_ALIASES and (not state or CITY_ALIASES[name][1] == state.strip().upper()):
+            name, state = CITY_ALIASES[name]
+        if state:
+            key = f"{name}|{state.strip().upper()}"
+            i = self._lower_bound(key)
+            if i < self._count and self._key_at(i) == key:
+                return self._record_at(i)
+            return None
+        matches = [i for _, i in zip(range(2), self._scan(f"{name}|"))]
+        return self._record_at(matches[0]) if len(matches) == 1 else None
+
+    def search(self, prefix: str, state: Optional[str] = None, limit: int = 10) -> List[CityRecord]:
+        """Return up to ``limit`` cities whose normalized name starts with ``prefix``"""
+        results = []
+        wanted_state = (state or "").strip().upper()
+        for i in self._scan(normalize_city(prefix)):
+            record = self._record_at(i)
+            if wanted_state and record.state != wanted_state:
+                continue
+            results.append(record)
+            if len(results) >= limit:
+                break
+        return results
+
+
+def load_city_index(path: str = CITY_INDEX_PATH) -> Optional[CityIndex]:
+    """Load the prebuilt index, or return None when it has not been built"""
+    if not os.path.exists(path):
+        return None
+    return CityIndex(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <city.list.json[.gz]> [output.idx]")
+        sys.exit(1)
+    output = sys.argv[2] if len(sys.argv) == 3 else CITY_INDEX_PATH
+    count = build_index(sys.argv[1], output)
+    print(f"Wrote {count} US cities to {output}")
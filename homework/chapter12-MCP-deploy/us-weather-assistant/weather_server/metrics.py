@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the US Weather Assistant MCP Server
+
+Keeps histograms, counters and gauges in memory so the server can report
+where tool time goes: upstream HTTP, rate-limit queueing, JSON parsing or
+formatting. Metrics can be read as a JSON snapshot (with p50/p95/p99
+estimates) or rendered in the Prometheus text exposition format.
+
+Everything runs on the event loop thread, so no locking is needed.
+"""
+
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond cache hits up to the HTTP timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label sets are stored as sorted (name, value) tuples so they can be dict keys
+Labels = Tuple[Tuple[str, str], ...]
+# Collectors are called at read time and yield (kind, name, labels, value) samples for external state
+Collector = Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed values"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is the +Inf bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+        }
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_key(labels: Labels) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels) or "total"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Registry of named metrics; series are created on first use"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Collector] = []
+
+    def describe(self, name: str, help_text: str):
+        """Set the HELP text used in the Prometheus output"""
+        self._help[name] = help_text
+
+    def register_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def observe(self, name: str, value: float, **labels: Any):
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        """Return the histogram for these labels, or None before its first observation"""
+        return self.histograms.get(name, {}).get(_labels(labels))
+
+    def inc(self, name: str, amount: float = 1, **labels: Any):
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def add(self, name: str, delta: float, **labels: Any):
+        """Move a gauge up or down, e.g. for in-flight request counts"""
+        series = self.gauges.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + delta
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe how long the block takes, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def track(self, scope: str, **labels: Any) -> Iterator[None]:
+        """Time an operation into ``{scope}_duration_seconds``, count it in
+        ``{scope}_in_flight`` while it runs, and count exceptions by type in ``errors_total``
+
+        Cancellation, such as the losing side of a hedged request, is not an
+        error: it is counted in ``cancelled_total`` and its truncated duration
+        is left out so it does not pull down the p95 used as the hedge delay.
+        """
+        self.add(f"{scope}_in_flight", 1, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.inc("cancelled_total", scope=scope)
+            raise
+        except BaseException as e:
+            self.inc("errors_total", scope=scope, type=type(e).__name__)
+            self.observe(f"{scope}_duration_seconds", time.perf_counter() - start, **labels)
+            raise
+        else:
+            self.observe(f"{scope}_duration_seconds", time.perf_counter() - start, **labels)
+        finally:
+            self.add(f"{scope}_in_flight", -1, **labels)
+
+    def _collected(self) -> List[Tuple[str, str, Dict[str, str], float]]:
+        samples = []
+        for collector in self._collectors:
+            samples.extend(collector())
+        return samples
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as nested dictionaries keyed by "label=value,..." strings"""
+        result: Dict[str, Any] = {
+            "histograms": {
+                name: {_label_key(labels): hist.snapshot() for labels, hist in series.items()}
+                for name, series in self.histograms.items()
+            },
+            "counters": {
+                name: {_label_key(labels): value for labels, value in series.items()}
+                for name, series in self.counters.items()
+            },
+            "gauges": {
+                name: {_label_key(labels): value for labels, value in series.items()}
+                for name, series in self.gauges.items()
+            },
+        }
+        for kind, name, labels, value in self._collected():
+            section = "counters" if kind == "counter" else "gauges"
+            result[section].setdefault(name, {})[_label_key(_labels(labels))] = value
+        return result
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (0.0.4)"""
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> str:
+            full_name = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        for name, series in sorted(self.histograms.items()):
+            full_name = header(name, "histogram")
+            for labels, hist in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(hist.buckets + (float("inf"),), hist.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else _format_number(bound)
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_number(hist.sum)}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {hist.count}")
+
+        collected: Dict[Tuple[str, str], Dict[Labels, float]] = {}
+        for kind, name, labels, value in self._collected():
+            collected.setdefault((name, kind), {})[_labels(labels)] = value
+        plain = [(name, "counter", series) for name, series in self.counters.items()]
+        plain += [(name, "gauge", series) for name, series in self.gauges.items()]
+        plain += [(name, kind, series) for (name, kind), series in collected.items()]
+        for name, kind, series in sorted(plain, key=lambda item: item[0]):
+            full_name = header(name, kind)
+            for labels, value in series.items():
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the server
+metrics = Metrics("weather_assistant")
+metrics.describe("tool_duration_seconds", "MCP tool call latency")
+metrics.describe("tool_in_flight", "Tool calls currently running")
+metrics.describe("upstream_duration_seconds", "OpenWeatherMap request latency, including body parsing")
+metrics.describe("upstream_in_flight", "OpenWeatherMap requests currently in flight")
+metrics.describe("upstream_responses_total", "OpenWeatherMap responses by status code")
+metrics.describe("stage_duration_seconds", "Time per stage: queue (rate limiter), network (until headers), parse (body), format (tool output)")
+metrics.describe("errors_total", "Exceptions by scope and type")
+metrics.describe("cancelled_total", "Cancelled operations by scope, e.g. hedged requests that lost; not counted as errors")
+metrics.describe("cache_hits_total", "Cache lookups served from cache, fresh or stale")
+metrics.describe("cache_misses_total", "Cache lookups that went upstream")
+metrics.describe("cache_hit_ratio", "Share of cache lookups served from cache")
+metrics.describe("cache_entries", "Entries in the response cache")
+metrics.describe("rate_limit_queue_depth", "Requests waiting for a rate-limit token")
+metrics.describe("circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open")
+metrics.describe("hedges_total", "Hedged duplicate requests sent")
+metrics.describe("hedge_wins_total", "Hedged requests that finished before the original")
+metrics.describe("prefetch_tracked_keys", "Cache keys with tracked access frequency")
+metrics.describe("prefetch_refreshes_total", "Background refreshes of hot cache keys")
+metrics.describe("rate_limit_rate", "Current upstream request rate in requests per second")
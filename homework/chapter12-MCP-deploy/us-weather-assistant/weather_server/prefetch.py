@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Background prefetch of frequently requested locations
+
+An AccessTracker keeps an exponentially decaying request count per cache
+key, so locations that were popular an hour ago fade out. A Prefetcher
+wakes up periodically and refreshes the hottest keys whose cache entries
+are about to expire, so repeated questions about the same cities keep
+hitting a fresh cache. Each cycle sends at most a fixed number of
+upstream requests, which keeps prefetching within a share of the quota.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger("weather-server")
+
+# Starts a refresh of one cache key and returns something to await for its completion
+Refresher = Callable[[], Awaitable[object]]
+
+
+class AccessTracker:
+    """Exponentially decayed access counts per key
+
+    Instead of decaying every score over time, each new access is weighted
+    by 2 ** (elapsed / half_life) relative to a fixed starting point.
+    Comparing stored scores then ranks keys exactly as decayed counts would.
+    """
+
+    def __init__(self, half_life: float = 1800, max_keys: int = 1000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._origin = time.monotonic()
+        self._scores: Dict[Hashable, float] = {}
+        self._refreshers: Dict[Hashable, Refresher] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def record(self, key: Hashable, refresher: Refresher):
+        """Count one access to ``key`` and remember how to refresh it"""
+        exponent = (time.monotonic() - self._origin) / self.half_life
+        if exponent > 64:
+            self._rebase()
+            exponent = (time.monotonic() - self._origin) / self.half_life
+        self._scores[key] = self._scores.get(key, 0.0) + math.pow(2.0, exponent)
+        self._refreshers[key] = refresher
+        if len(self._scores) > self.max_keys * 1.1:
+            for cold_key in sorted(self._scores, key=self._scores.get)[:len(self._scores) - self.max_keys]:
+                del self._scores[cold_key]
+                del self._refreshers[cold_key]
+
+    def _rebase(self):
+        """Move the starting point to now so weights stay within float range"""
+        now = time.monotonic()
+        factor = math.pow(2.0, -(now - self._origin) / self.half_life)
+        self._scores = {key: score * factor for key, score in self._scores.items()}
+        self._origin = now
+
+    def score(self, key: Hashable) -> float:
+        """Decayed access count of ``key`` as of now"""
+        elapsed = (time.monotonic() - self._origin) / self.half_life
+        return self._scores.get(key, 0.0) * math.pow(2.0, -elapsed)
+
+    def hottest(self, k: int) -> List[Tuple[Hashable, Refresher]]:
+        keys = sorted(self._scores, key=self._scores.get, reverse=True)[:k]
+        return [(key, self._refreshers[key]) for key in keys]
+
+
+class Prefetcher:
+    """Periodically refresh the hottest keys shortly before they expire"""
+
+    def __init__(
+        self,
+        tracker: AccessTracker,
+        expires_in: Callable[[Hashable], Optional[float]],
+        top_k: int,
+        interval: float,
+        lead_time: float,
+        budget_per_cycle: int,
+    ):
+        self.tracker = tracker
+        self.expires_in = expires_in  # seconds until a key expires, None if it is not cached
+        self.top_k = top_k
+        self.interval = interval
+        self.lead_time = lead_time
+        self.budget_per_cycle = budget_per_cycle
+        self.refreshed = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """Refresh the hot keys that expire within the lead time; returns how many were refreshed"""
+        due = []
+        for key, refresher in self.tracker.hottest(self.top_k):
+            remaining = self.expires_in(key)
+            if remaining is not None and remaining <= self.lead_time:
+                due.append(refresher)
+                if len(due) >= self.budget_per_cycle:
+                    break
+        results = await asyncio.gather(*(refresher() for refresher in due), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        self.refreshed += len(results) - failed
+        self.failed += failed
+        return len(results)
+
+    def start(self):
+        if (self._task is None or self._task.done()) and self.top_k > 0 and self.budget_per_cycle > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning(f"Prefetch cycle failed: {e}")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Quota-aware upstream rate limiter for the US Weather Assistant MCP Server
+
+A token bucket paces requests to OpenWeatherMap. When the bucket is empty,
+callers wait in a priority queue, so interactive single-city lookups are
+served before bulk jobs. Each caller gives a deadline. If the expected wait
+is longer than that, the call fails at once with a retry-after hint.
+
+After a 429 response the limiter pauses for the upstream's Retry-After,
+halves its rate, and then ramps back up as requests succeed.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be sent within its deadline"""
+
+    def __init__(self, retry_after: float, message: str = "OpenWeatherMap rate limit reached"):
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"{message}; retry after {self.retry_after:.0f}s")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket with a priority wait queue and adaptive rate"""
+
+    def __init__(self, rate: float, burst: int, max_queue: int = 100, min_rate: Optional[float] = None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.burst = burst
+        self.max_queue = max_queue
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _estimated_wait(self, position: int, now: float) -> float:
+        """Seconds until the caller at ``position`` in the queue gets a token"""
+        pause = max(0.0, self._paused_until - now)
+        return pause + max(0.0, position + 1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """Wait for a token, raising RateLimitExceeded if none is available within ``timeout``"""
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self._paused_until and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        # Only waiters of equal or higher priority are ahead of this caller
+        ahead = sum(1 for p, _, _ in self._waiters if p <= priority)
+        estimate = self._estimated_wait(ahead, now)
+        if len(self._waiters) >= self.max_queue or (timeout is not None and estimate > timeout):
+            raise RateLimitExceeded(estimate)
+
+        # The queue only holds live waiters: expired and cancelled ones are removed
+        # at once, and a token granted to a caller that is cancelled goes back
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (priority, next(self._counter), future)
+        heapq.heappush(self._waiters, waiter)
+        self._schedule(now)
+        expiry = loop.call_later(timeout, self._expire, waiter) if timeout is not None else None
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._remove(waiter)
+            elif future.exception() is None:
+                self._release()
+            raise
+        finally:
+            if expiry is not None:
+                expiry.cancel()
+
+    def _remove(self, waiter: Tuple[int, int, asyncio.Future]):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+
+    def _expire(self, waiter: Tuple[int, int, asyncio.Future]):
+        """Fail a waiter whose deadline passed before it was granted a token"""
+        future = waiter[2]
+        if future.done():
+            return
+        self._remove(waiter)
+        future.set_exception(RateLimitExceeded(self._estimated_wait(self.queue_depth, time.monotonic())))
+
+    def _release(self):
+        """Return an unused token and pass it on to the next waiter"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = min(float(self.burst), self._tokens + 1)
+        if self._waiters:
+            self._schedule(now)
+
+    def _schedule(self, now: float):
+        if self._timer is not None:
+            return
+        delay = max(0.0, self._paused_until - now, (1 - self._tokens) / self.rate)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        """Hand out available tokens to queued waiters in priority order"""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and now >= self._paused_until and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            self._tokens -= 1
+            future.set_result(None)
+        if self._waiters:
+            self._schedule(now)
+
+    def record_success(self):
+        """Gradually restore the configured rate after upstream throttling"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+    def record_throttled(self, retry_after: Optional[float]) -> float:
+        """React to a 429: pause for Retry-After (or one token interval) and halve the rate
+
+        Returns the pause in seconds, for use as a retry-after hint.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self._paused_until = max(self._paused_until, now + pause)
+        self._tokens = 0.0
+        return pause
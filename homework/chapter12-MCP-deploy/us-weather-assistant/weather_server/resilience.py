@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Upstream fault tolerance for the US Weather Assistant MCP Server
+
+Each OpenWeatherMap endpoint gets a circuit breaker. After enough
+consecutive failures or slow responses it opens and requests fail at
+once instead of waiting for a timeout. After a cool-down one probe
+request is let through; success closes the breaker again.
+
+Hedged requests are optional: when a request has not finished after a
+delay (usually the endpoint's p95 latency), an identical request is sent
+and whichever succeeds first is used. The loser is cancelled.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Numeric values used when exporting breaker state as a metric
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the endpoint's breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(f"OpenWeatherMap {name} endpoint is unavailable; retry after {self.retry_after:.0f}s")
+
+
+class UpstreamError(Exception):
+    """A non-success HTTP response from the upstream API"""
+
+    def __init__(self, message: str, status: int):
+        self.status = status
+        super().__init__(message)
+
+
+class EndpointPolicy:
+    """Timeout, circuit breaker and hedging settings for one upstream endpoint"""
+
+    FIELDS = ("timeout", "failure_threshold", "slow_threshold", "reset_timeout", "hedge", "hedge_delay")
+
+    def __init__(
+        self,
+        timeout: float,
+        failure_threshold: int,
+        slow_threshold: float,
+        reset_timeout: float,
+        hedge: bool = False,
+        hedge_delay: float = 1.0,
+    ):
+        self.timeout = timeout  # seconds per attempt
+        self.failure_threshold = failure_threshold  # consecutive failures before opening
+        self.slow_threshold = slow_threshold  # successful responses slower than this count as failures
+        self.reset_timeout = reset_timeout  # seconds open before a probe is allowed
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay  # hedge delay used until there are enough samples for a p95
+
+    def with_overrides(self, overrides: Dict[str, Any]) -> "EndpointPolicy":
+        unknown = set(overrides) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown endpoint policy settings: {', '.join(sorted(unknown))}")
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(overrides)
+        return EndpointPolicy(**values)
+
+
+def load_policies(default: EndpointPolicy, overrides_json: Optional[str]) -> Dict[str, EndpointPolicy]:
+    """Parse per-endpoint overrides such as '{"forecast": {"hedge": true, "timeout": 8}}'"""
+    if not overrides_json:
+        return {}
+    return {endpoint: default.with_overrides(values) for endpoint, values in json.loads(overrides_json).items()}
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    def __init__(self, name: str, policy: EndpointPolicy):
+        self.name = name
+        self.policy = policy
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_request(self):
+        """Raise CircuitOpenError while open; when half-open, let a single probe through"""
+        if self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.policy.reset_timeout - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(self.name, remaining)
+
+    def record_success(self, duration: float):
+        self._probing = False
+        if duration > self.policy.slow_threshold:
+            self.record_failure()
+            return
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.policy.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give back the probe slot for outcomes that say nothing about upstream health"""
+        self._probing = False
+
+
+async def hedged(
+    call: Callable[[int], Awaitable[Any]],
+    delay: float,
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> Tuple[Any, bool]:
+    """Run ``call(0)``; if it is still running after ``delay`` seconds, also run ``call(1)``
+
+    Returns ``(result, hedge_won)`` for the first attempt that succeeds, or
+    raises the last error if both fail. Unfinished attempts are cancelled
+    and awaited before returning.
+    """
+    tasks = [asyncio.create_task(call(0))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.append(asyncio.create_task(call(1)))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is not tasks[0]
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
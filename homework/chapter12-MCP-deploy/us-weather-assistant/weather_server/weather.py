@@ -10,73 +10,466 @@ import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional
-import aiohttp
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+from pydantic import AnyUrl
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 from mcp.server.models import InitializationOptions
 import mcp.types as types
 from mcp.server import NotificationOptions, Server
 import mcp.server.stdio
+from city_index import CITY_INDEX_PATH, CityIndex, CityRecord, load_city_index
+from metrics import metrics
+from prefetch import AccessTracker, Prefetcher
+from rate_limiter import PRIORITY_BULK, PRIORITY_INTERACTIVE, RateLimiter, RateLimitExceeded, parse_retry_after
+from resilience import STATE_VALUES, CircuitBreaker, EndpointPolicy, UpstreamError, hedged, load_policies
+from weather_cache import WeatherCache
+
+# aiohttp and jsonschema take a few hundred milliseconds to import, which every
+# stdio client would pay at spawn time; aiohttp is imported on the first
+# upstream request and jsonschema on the first tool call instead
+if TYPE_CHECKING:
+    import aiohttp
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("weather-server")
 
 # OpenWeatherMap API configuration
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
 
-# Create MCP server instance
-server = Server("us-weather-assistant")
+# HTTP connection pool configuration (overridable via environment variables)
+HTTP_LIMIT = int(os.getenv("WEATHER_HTTP_LIMIT", "100"))  # total simultaneous connections
+HTTP_LIMIT_PER_HOST = int(os.getenv("WEATHER_HTTP_LIMIT_PER_HOST", "10"))  # connections per upstream host
+HTTP_DNS_CACHE_TTL = int(os.getenv("WEATHER_HTTP_DNS_CACHE_TTL", "300"))  # seconds to cache DNS lookups
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("WEATHER_HTTP_KEEPALIVE_TIMEOUT", "60"))  # idle keep-alive seconds
+HTTP_TIMEOUT = float(os.getenv("WEATHER_HTTP_TIMEOUT", "30"))  # total request timeout in seconds
+
+# OpenWeatherMap's group endpoint accepts at most 20 city IDs per request
+GROUP_MAX_IDS = 20
+
+# Response cache configuration (overridable via environment variables)
+CACHE_CURRENT_TTL = float(os.getenv("WEATHER_CACHE_CURRENT_TTL", "600"))  # seconds current conditions stay fresh
+CACHE_FORECAST_TTL = float(os.getenv("WEATHER_CACHE_FORECAST_TTL", "1800"))  # seconds forecasts stay fresh
+CACHE_MAX_STALE = float(os.getenv("WEATHER_CACHE_MAX_STALE", "3600"))  # seconds stale data may be served while refreshing
+CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "512"))  # LRU size cap
+
+# Upstream rate limit configuration (overridable via environment variables)
+RATE_LIMIT_PER_MINUTE = float(os.getenv("WEATHER_RATE_LIMIT_PER_MINUTE", "60"))  # sustained requests per minute
+RATE_LIMIT_BURST = int(os.getenv("WEATHER_RATE_LIMIT_BURST", "10"))  # requests allowed back-to-back
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("WEATHER_RATE_LIMIT_MAX_QUEUE", "100"))  # waiting requests before failing fast
+RATE_LIMIT_MAX_WAIT = float(os.getenv("WEATHER_RATE_LIMIT_MAX_WAIT", "10"))  # seconds an interactive call may queue
+RATE_LIMIT_BULK_MAX_WAIT = float(os.getenv("WEATHER_RATE_LIMIT_BULK_MAX_WAIT", "30"))  # seconds a bulk call may queue
+
+# Background prefetch of frequently requested locations (overridable via environment variables)
+PREFETCH_TOP_K = int(os.getenv("WEATHER_PREFETCH_TOP_K", "30"))  # hottest cache keys kept warm; 0 disables prefetch
+PREFETCH_INTERVAL = float(os.getenv("WEATHER_PREFETCH_INTERVAL", "60"))  # seconds between prefetch cycles
+PREFETCH_LEAD_TIME = float(os.getenv("WEATHER_PREFETCH_LEAD_TIME", "120"))  # refresh entries expiring within this many seconds
+PREFETCH_QUOTA_SHARE = float(os.getenv("WEATHER_PREFETCH_QUOTA_SHARE", "0.2"))  # share of the rate limit prefetch may use
+PREFETCH_HALF_LIFE = float(os.getenv("WEATHER_PREFETCH_HALF_LIFE", "1800"))  # seconds for an access to count half as much
+
+# Upstream fault tolerance defaults for every endpoint (weather, forecast, group); override per
+# endpoint with WEATHER_ENDPOINT_POLICIES, e.g. '{"forecast": {"hedge": true, "timeout": 8}}'
+UPSTREAM_TIMEOUT = float(os.getenv("WEATHER_UPSTREAM_TIMEOUT", str(HTTP_TIMEOUT)))  # seconds per attempt
+BREAKER_FAILURES = int(os.getenv("WEATHER_BREAKER_FAILURES", "5"))  # consecutive failures before failing fast
+BREAKER_SLOW_SECONDS = float(os.getenv("WEATHER_BREAKER_SLOW_SECONDS", "10"))  # slower responses count as failures
+BREAKER_RESET_SECONDS = float(os.getenv("WEATHER_BREAKER_RESET_SECONDS", "30"))  # seconds before a probe request
+HEDGE_ENABLED = os.getenv("WEATHER_HEDGE", "0") == "1"  # send a duplicate request when one is slower than p95
+HEDGE_DEFAULT_DELAY = float(os.getenv("WEATHER_HEDGE_DELAY", "1.0"))  # hedge delay until p95 can be estimated
+HEDGE_MIN_DELAY = float(os.getenv("WEATHER_HEDGE_MIN_DELAY", "0.05"))  # lower bound for the p95-based delay
+HEDGE_MIN_SAMPLES = 20  # latency samples needed before trusting the p95
+DEFAULT_POLICY = EndpointPolicy(
+    timeout=UPSTREAM_TIMEOUT,
+    failure_threshold=BREAKER_FAILURES,
+    slow_threshold=BREAKER_SLOW_SECONDS,
+    reset_timeout=BREAKER_RESET_SECONDS,
+    hedge=HEDGE_ENABLED,
+    hedge_delay=HEDGE_DEFAULT_DELAY,
+)
+ENDPOINT_POLICIES = load_policies(DEFAULT_POLICY, os.getenv("WEATHER_ENDPOINT_POLICIES"))
+
+def hedge_delay(endpoint: str, policy: EndpointPolicy) -> float:
+    """Delay before hedging: the endpoint's p95 latency, or the configured default with too few samples"""
+    hist = metrics.histogram("upstream_duration_seconds", endpoint=endpoint)
+    if hist is None or hist.count < HEDGE_MIN_SAMPLES:
+        return policy.hedge_delay
+    return min(max(hist.quantile(0.95), HEDGE_MIN_DELAY), policy.timeout)
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether an error says the upstream is unhealthy (4xx responses and our own throttling do not)"""
+    if isinstance(error, UpstreamError):
+        return error.status >= 500
+    return not isinstance(error, RateLimitExceeded)
 
 class WeatherService:
-    """Service class to handle weather API calls"""
+    """Service class to handle weather API calls
+    
+    A single instance is meant to live for the whole server run so that its
+    aiohttp session (and the pooled, keep-alive connections behind it) is
+    reused across tool calls. The session is created lazily on first use.
+    """
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        limit: int = HTTP_LIMIT,
+        limit_per_host: int = HTTP_LIMIT_PER_HOST,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        timeout: float = HTTP_TIMEOUT,
+    ):
         self.api_key = api_key
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
         self.session = None
+        self._city_index: Optional[CityIndex] = None
+        self._city_index_loaded = False
+        self.cache = WeatherCache(max_entries=CACHE_MAX_ENTRIES, max_stale=CACHE_MAX_STALE)
+        self.rate_limiter = RateLimiter(
+            rate=RATE_LIMIT_PER_MINUTE / 60,
+            burst=RATE_LIMIT_BURST,
+            max_queue=RATE_LIMIT_MAX_QUEUE,
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # City IDs waiting for the next group request, and the group requests in flight
+        self._group_batch: Dict[int, asyncio.Future] = {}
+        self._group_tasks: Set[asyncio.Task] = set()
+        self.access = AccessTracker(half_life=PREFETCH_HALF_LIFE, max_keys=CACHE_MAX_ENTRIES)
+        self.prefetcher = Prefetcher(
+            self.access,
+            self._expires_in,
+            top_k=PREFETCH_TOP_K,
+            interval=PREFETCH_INTERVAL,
+            lead_time=PREFETCH_LEAD_TIME,
+            budget_per_cycle=int(RATE_LIMIT_PER_MINUTE * PREFETCH_QUOTA_SHARE * PREFETCH_INTERVAL / 60),
+        )
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        await self.start()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        await self.close()
+    
+    async def start(self) -> "aiohttp.ClientSession":
+        """Create the pooled HTTP session if it is not open yet"""
+        if self.session is None or self.session.closed:
+            import aiohttp
+            
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+    
+    def start_prefetch(self):
+        """Start keeping the most requested locations warm in the background"""
+        self.prefetcher.start()
+    
+    async def close(self):
+        """Close the HTTP session and release pooled connections"""
+        await self.prefetcher.stop()
+        await self.cache.close()
+        for task in list(self._group_tasks):
+            task.cancel()
+        if self._group_tasks:
+            await asyncio.gather(*self._group_tasks, return_exceptions=True)
+        if self.session and not self.session.closed:
             await self.session.close()
+        self.session = None
     
-    async def get_current_weather(self, city: str, state: str = None) -> Dict[str, Any]:
-        """Get current weather for a US city"""
-        location = f"{city},{state},US" if state else f"{city},US"
-        url = f"{OPENWEATHER_BASE_URL}/weather"
+    @property
+    def city_index(self) -> Optional[CityIndex]:
+        """The offline city index, memory-mapped on first access (None if not built)"""
+        if not self._city_index_loaded:
+            self._city_index_loaded = True
+            try:
+                self._city_index = load_city_index()
+                if self._city_index is None:
+                    logger.warning(f"No city index at {CITY_INDEX_PATH}, falling back to name queries "
+                                   "(see README to build one)")
+            except (OSError, ValueError) as e:
+                logger.warning(f"City index unavailable, falling back to name queries: {e}")
+        return self._city_index
+    
+    def resolve_city(self, city: str, state: str = None) -> Optional[CityRecord]:
+        """Resolve a city name to its OpenWeatherMap ID and coordinates using the offline index"""
+        if self.city_index is None:
+            return None
+        return self.city_index.lookup(city, state)
+    
+    def location_params(self, city: str, state: str = None, city_id: int = None) -> Dict[str, Any]:
+        """Build the location query: by city ID when known, otherwise by free-text name"""
+        if city_id is None:
+            record = self.resolve_city(city, state) if city else None
+            city_id = record.id if record else None
+        if city_id is not None:
+            return {"id": city_id}
+        return {"q": f"{city},{state},US" if state else f"{city},US"}
+    
+    async def _request(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        error_label: str,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Dict[str, Any]:
+        """GET an OpenWeatherMap endpoint and return its JSON body
+        
+        Requests pass through the endpoint's circuit breaker and then the
+        rate limiter; bulk requests queue behind interactive ones and may
+        wait longer. Each attempt has its own timeout, and endpoints with
+        hedging enabled send a second attempt when the first is slow.
+        """
+        policy = ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY)
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(endpoint, policy)
+        breaker.before_request()
+        
+        url = f"{OPENWEATHER_BASE_URL}/{endpoint}"
         params = {
-            "q": location,
+            **params,
             "appid": self.api_key,
             "units": "imperial"  # Fahrenheit for US
         }
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                return await response.json()
+        async def attempt(number: int) -> Dict[str, Any]:
+            # The hedge only goes out if a token is free right now; it never queues
+            max_wait = RATE_LIMIT_BULK_MAX_WAIT if priority == PRIORITY_BULK else RATE_LIMIT_MAX_WAIT
+            with metrics.timer("stage_duration_seconds", stage="queue"):
+                await self.rate_limiter.acquire(priority, timeout=0 if number else max_wait)
+            return await asyncio.wait_for(self._get(endpoint, url, params, error_label), policy.timeout)
+        
+        started = time.monotonic()
+        try:
+            if policy.hedge:
+                data, hedge_won = await hedged(
+                    attempt,
+                    hedge_delay(endpoint, policy),
+                    on_hedge=lambda: metrics.inc("hedges_total", endpoint=endpoint),
+                )
+                if hedge_won:
+                    metrics.inc("hedge_wins_total", endpoint=endpoint)
+            else:
+                data = await attempt(0)
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure()
             else:
-                error_data = await response.json()
-                raise Exception(f"Weather API error: {error_data.get('message', 'Unknown error')}")
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success(time.monotonic() - started)
+        return data
     
-    async def get_forecast(self, city: str, state: str = None, days: int = 5) -> Dict[str, Any]:
-        """Get weather forecast for a US city"""
-        location = f"{city},{state},US" if state else f"{city},US"
-        url = f"{OPENWEATHER_BASE_URL}/forecast"
-        params = {
-            "q": location,
-            "appid": self.api_key,
-            "units": "imperial",
-            "cnt": min(days * 8, 40)  # API returns 3-hour intervals, max 40 entries
-        }
+    async def _get(self, endpoint: str, url: str, params: Dict[str, Any], error_label: str) -> Dict[str, Any]:
+        """Send one GET and decode the response, raising on any non-200 status"""
+        import aiohttp  # already loaded by start()
         
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                return await response.json()
+        session = await self.start()
+        with metrics.track("upstream", endpoint=endpoint):
+            started = time.perf_counter()
+            async with session.get(url, params=params) as response:
+                metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="network")
+                metrics.inc("upstream_responses_total", endpoint=endpoint, status=response.status)
+                if response.status == 200:
+                    self.rate_limiter.record_success()
+                    with metrics.timer("stage_duration_seconds", stage="parse"):
+                        return await response.json()
+                elif response.status == 429:
+                    retry_after = self.rate_limiter.record_throttled(parse_retry_after(response.headers.get("Retry-After")))
+                    raise RateLimitExceeded(retry_after, f"{error_label}: rate limited by OpenWeatherMap")
+                else:
+                    try:
+                        message = (await response.json(content_type=None)).get("message", "Unknown error")
+                    except (ValueError, AttributeError, aiohttp.ClientError):
+                        message = f"HTTP {response.status}"
+                    raise UpstreamError(f"{error_label}: {message}", response.status)
+    
+    @staticmethod
+    def _cache_key(endpoint: str, location: Dict[str, Any]) -> tuple:
+        return (endpoint, tuple(sorted(location.items())))
+    
+    def _expires_in(self, key: tuple) -> Optional[float]:
+        entry = self.cache.peek(key)
+        return entry.fresh_until - time.monotonic() if entry is not None else None
+    
+    def _track_access(self, key: tuple, ttl: float, endpoint: str, params: Dict[str, Any], error_label: str):
+        """Count a request for ``key`` so hot locations are prefetched (at bulk priority) before expiring"""
+        self.access.record(key, lambda: self.cache.refresh(
+            key, ttl, lambda: self._request(endpoint, params, error_label, priority=PRIORITY_BULK)
+        ))
+    
+    async def get_current_weather(self, city: str, state: str = None, city_id: int = None) -> Dict[str, Any]:
+        """Get current weather for a US city"""
+        location = self.location_params(city, state, city_id)
+        key = self._cache_key("weather", location)
+        self._track_access(key, CACHE_CURRENT_TTL, "weather", location, "Weather API error")
+        return await self.cache.get_or_fetch(
+            key,
+            CACHE_CURRENT_TTL,
+            lambda: self._request("weather", location, "Weather API error"),
+        )
+    
+    async def get_current_weather_group(self, city_ids: List[int]) -> Dict[int, Any]:
+        """Get current weather for many cities by ID using the group endpoint
+        
+        Each city goes through the weather cache like a single lookup, so
+        fresh entries are served directly, stale ones are refreshed in the
+        background and concurrent callers share one fetch. The cities that do
+        need fetching are batched into group requests of GROUP_MAX_IDS, sent
+        concurrently. Returns a mapping of city ID to its weather data, or to
+        an error message for IDs that could not be fetched.
+        """
+        async def lookup(city_id: int) -> Any:
+            location = {"id": city_id}
+            key = self._cache_key("weather", location)
+            self._track_access(key, CACHE_CURRENT_TTL, "weather", location, "Weather API error")
+            try:
+                return await self.cache.get_or_fetch(key, CACHE_CURRENT_TTL, lambda: self._load_from_group(city_id))
+            except Exception as e:
+                return str(e)
+            
+        results = await asyncio.gather(*(lookup(city_id) for city_id in city_ids))
+        return dict(zip(city_ids, results))
+    
+    def _load_from_group(self, city_id: int) -> "asyncio.Future[Dict[str, Any]]":
+        """Queue ``city_id`` for the next group request and return a future for its entry
+        
+        IDs queued during the same event loop pass are sent together, so the
+        cache's per-city fetches for one bulk call share group requests.
+        """
+        future = self._group_batch.get(city_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._group_batch:
+                loop.call_soon(self._flush_group_batch)
+            future = self._group_batch[city_id] = loop.create_future()
+        return future
+    
+    def _flush_group_batch(self):
+        """Send the queued IDs as concurrent group requests of at most GROUP_MAX_IDS"""
+        batch, self._group_batch = self._group_batch, {}
+        city_ids = list(batch)
+        for i in range(0, len(city_ids), GROUP_MAX_IDS):
+            chunk = {city_id: batch[city_id] for city_id in city_ids[i:i + GROUP_MAX_IDS]}
+            task = asyncio.create_task(self._fetch_group_chunk(chunk))
+            self._group_tasks.add(task)
+            task.add_done_callback(self._group_tasks.discard)
+    
+    async def _fetch_group_chunk(self, chunk: Dict[int, asyncio.Future]):
+        """Fetch one group request and settle each city's future with its entry or the error"""
+        try:
+            response = await self._get_group(list(chunk))
+        except asyncio.CancelledError:
+            for future in chunk.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in chunk.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        entries = {entry["id"]: entry for entry in response.get("list", [])}
+        for city_id, future in chunk.items():
+            if future.done():
+                continue  # the waiting cache fetch was cancelled
+            if city_id in entries:
+                future.set_result(entries[city_id])
             else:
-                error_data = await response.json()
-                raise Exception(f"Forecast API error: {error_data.get('message', 'Unknown error')}")
+                future.set_exception(UpstreamError(f"Group weather API error: no data for city {city_id}", 404))
+    
+    async def _get_group(self, city_ids: List[int]) -> Dict[str, Any]:
+        params = {"id": ",".join(str(city_id) for city_id in city_ids)}
+        return await self._request("group", params, "Group weather API error", priority=PRIORITY_BULK)
+    
+    async def get_forecast(self, city: str, state: str = None, city_id: int = None) -> Dict[str, Any]:
+        """Get weather forecast for a US city
+        
+        The full 5-day forecast (3-hour intervals, 40 entries) is fetched and
+        cached once per location. Callers trim it to the days they need after
+        grouping by local date, see ``aggregate_forecast``.
+        """
+        location = self.location_params(city, state, city_id)
+        key = self._cache_key("forecast", location)
+        self._track_access(key, CACHE_FORECAST_TTL, "forecast", {**location, "cnt": 40}, "Forecast API error")
+        forecast_data = await self.cache.get_or_fetch(
+            key,
+            CACHE_FORECAST_TTL,
+            lambda: self._request("forecast", {**location, "cnt": 40}, "Forecast API error"),
+        )
+        return forecast_data
+
+# Shared WeatherService for the lifetime of the server process
+weather_service: Optional[WeatherService] = None
+# Number of sessions currently using it (the lifespan runs once per session)
+_active_sessions = 0
+
+def get_weather_service() -> WeatherService:
+    """Return the process-wide WeatherService, creating it on first use"""
+    global weather_service
+    if weather_service is None:
+        weather_service = WeatherService(OPENWEATHER_API_KEY)
+    return weather_service
+
+@asynccontextmanager
+async def server_lifespan(server: Server) -> AsyncIterator[Dict[str, Any]]:
+    """Own the shared WeatherService for the server run and close it on shutdown
+    
+    With several concurrent sessions the service is only closed when the
+    last one ends, so one client disconnecting does not cut off the others.
+    """
+    global _active_sessions
+    service = get_weather_service()
+    _active_sessions += 1
+    service.start_prefetch()
+    try:
+        yield {"weather_service": service}
+    finally:
+        _active_sessions -= 1
+        if _active_sessions == 0:
+            await service.close()
+
+def service_samples() -> Iterator[Tuple[str, str, Dict[str, str], float]]:
+    """Export cache and rate limiter state when metrics are read"""
+    if weather_service is None:
+        return
+    stats = weather_service.cache.stats()
+    yield ("gauge", "cache_entries", {"cache": "weather"}, stats["entries"])
+    yield ("counter", "cache_hits_total", {"cache": "weather"}, stats["hits"] + stats["stale_hits"])
+    yield ("counter", "cache_misses_total", {"cache": "weather"}, stats["misses"])
+    yield ("gauge", "cache_hit_ratio", {"cache": "weather"}, stats["hit_ratio"])
+    yield ("gauge", "rate_limit_queue_depth", {}, weather_service.rate_limiter.queue_depth)
+    yield ("gauge", "rate_limit_rate", {}, round(weather_service.rate_limiter.rate, 4))
+    yield ("gauge", "prefetch_tracked_keys", {}, len(weather_service.access))
+    yield ("counter", "prefetch_refreshes_total", {"result": "ok"}, weather_service.prefetcher.refreshed)
+    yield ("counter", "prefetch_refreshes_total", {"result": "error"}, weather_service.prefetcher.failed)
+
+metrics.register_collector(service_samples)
+
+def breaker_samples() -> Iterator[Tuple[str, str, Dict[str, str], float]]:
+    if weather_service is None:
+        return
+    for endpoint, breaker in weather_service.breakers.items():
+        yield ("gauge", "circuit_state", {"endpoint": endpoint}, STATE_VALUES[breaker.state])
+
+metrics.register_collector(breaker_samples)
+
+# Create MCP server instance
+server = Server("us-weather-assistant", lifespan=server_lifespan)
 
 def format_current_weather(weather_data: Dict[str, Any]) -> str:
     """Format current weather data into readable text"""
@@ -105,89 +498,308 @@ def format_current_weather(weather_data: Dict[str, Any]) -> str:
     
     return result
 
-def format_forecast(forecast_data: Dict[str, Any]) -> str:
-    """Format forecast data into readable text"""
-    city = forecast_data["city"]["name"]
-    country = forecast_data["city"]["country"]
-    forecasts = forecast_data["list"]
+def format_weather_line(weather_data: Dict[str, Any]) -> str:
+    """Format current weather data as a single compact line (used for bulk results)"""
+    main = weather_data["main"]
+    description = weather_data["weather"][0]["description"].title()
+    line = f"{weather_data['name']}: 🌡️ {round(main['temp'])}°F (feels like {round(main['feels_like'])}°F), ☁️ {description}, 💧 {main['humidity']}%"
+    wind = weather_data.get("wind", {})
+    if "speed" in wind:
+        line += f", 💨 {round(wind['speed'])} mph"
+    return line
+
+def format_bulk_weather(results: List[tuple]) -> str:
+    """Format (label, weather data or error message) pairs into one combined result"""
+    found = sum(1 for _, data in results if isinstance(data, dict))
+    result = f"Current Weather for {found} of {len(results)} cities:\n"
+    for label, data in results:
+        if isinstance(data, dict):
+            result += f"- {label} → {format_weather_line(data)}\n"
+        else:
+            result += f"- {label} → ⚠️ {data}\n"
+    return result
+
+def aggregate_forecast(forecast_data: Dict[str, Any], max_days: int = 5) -> Dict[str, Any]:
+    """Aggregate 3-hour forecast entries into daily summaries in a single pass
+    
+    Entries are grouped by the city's local date, using the UTC offset in
+    ``city.timezone``. For each day this computes the high, low and mean
+    temperature, mean humidity, the highest precipitation probability and
+    the conditions closest to local noon. Only the first ``max_days`` local
+    dates are kept.
+    """
+    city = forecast_data["city"]
+    tz_offset = city.get("timezone", 0)
+    days: Dict[str, Dict[str, Any]] = {}
+    
+    for forecast in forecast_data["list"]:
+        main = forecast["main"]
+        if "dt" in forecast:
+            local_time = datetime.fromtimestamp(forecast["dt"] + tz_offset, tz=timezone.utc)
+        else:
+            local_time = datetime.strptime(forecast["dt_txt"], "%Y-%m-%d %H:%M:%S")
+        date = local_time.date().isoformat()
+        
+        day = days.get(date)
+        if day is None:
+            if len(days) == max_days:
+                break
+            day = days[date] = {
+                "date": date,
+                "high": main["temp_max"],
+                "low": main["temp_min"],
+                "temp_sum": 0.0,
+                "humidity_sum": 0.0,
+                "count": 0,
+                "precipitation_probability": 0.0,
+                "conditions": None,
+                "noon_distance": 24,
+            }
+        day["high"] = max(day["high"], main["temp_max"])
+        day["low"] = min(day["low"], main["temp_min"])
+        day["temp_sum"] += main.get("temp", (main["temp_max"] + main["temp_min"]) / 2)
+        day["humidity_sum"] += main["humidity"]
+        day["count"] += 1
+        day["precipitation_probability"] = max(day["precipitation_probability"], forecast.get("pop", 0.0))
+        noon_distance = abs(local_time.hour - 12)
+        if noon_distance < day["noon_distance"]:
+            day["noon_distance"] = noon_distance
+            day["conditions"] = forecast["weather"][0]["description"].title()
     
-    result = f"Weather Forecast for {city}, {country}:\n\n"
+    return {
+        "city": city["name"],
+        "country": city["country"],
+        "timezone_offset": tz_offset,
+        "units": {"temperature": "°F", "humidity": "%", "precipitation_probability": "%"},
+        "days": [
+            {
+                "date": day["date"],
+                "high": round(day["high"], 1),
+                "low": round(day["low"], 1),
+                "mean": round(day["temp_sum"] / day["count"], 1),
+                "humidity": round(day["humidity_sum"] / day["count"]),
+                "precipitation_probability": round(day["precipitation_probability"] * 100),
+                "conditions": day["conditions"],
+            }
+            for day in days.values()
+        ],
+    }
+
+def format_forecast(forecast_data: Dict[str, Any], max_days: int = 5) -> str:
+    """Format forecast data into readable text, covering at most ``max_days`` local days"""
+    summary = aggregate_forecast(forecast_data, max_days)
     
-    # Group forecasts by day
-    daily_forecasts = {}
-    for forecast in forecasts:
-        date = forecast["dt_txt"].split(" ")[0]
-        if date not in daily_forecasts:
-            daily_forecasts[date] = []
-        daily_forecasts[date].append(forecast)
+    result = f"Weather Forecast for {summary['city']}, {summary['country']}:\n\n"
     
     # Format each day
-    for date, day_forecasts in list(daily_forecasts.items())[:5]:  # Limit to 5 days
-        # Get midday forecast for the day summary
-        midday_forecast = day_forecasts[len(day_forecasts)//2]
-        main = midday_forecast["main"]
-        weather = midday_forecast["weather"][0]
-        
-        temp_high = max(f["main"]["temp_max"] for f in day_forecasts)
-        temp_low = min(f["main"]["temp_min"] for f in day_forecasts)
-        
-        result += f"📅 {date}:\n"
-        result += f"   🌡️ High: {round(temp_high)}°F, Low: {round(temp_low)}°F\n"
-        result += f"   ☁️ {weather['description'].title()}\n"
-        result += f"   💧 Humidity: {main['humidity']}%\n\n"
+    for day in summary["days"]:
+        result += f"📅 {day['date']}:\n"
+        result += f"   🌡️ High: {round(day['high'])}°F, Low: {round(day['low'])}°F (avg {round(day['mean'])}°F)\n"
+        result += f"   ☁️ {day['conditions']}\n"
+        result += f"   💧 Humidity: {day['humidity']}%\n"
+        result += f"   ☔ Chance of Precipitation: {day['precipitation_probability']}%\n\n"
     
     return result
 
-@server.list_tools()
-async def handle_list_tools() -> List[types.Tool]:
-    """List available weather tools"""
-    return [
-        types.Tool(
-            name="get_current_weather",
-            description="Get current weather conditions for a US city",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city name (e.g., 'New York', 'Los Angeles')"
+async def get_bulk_weather(weather_service: WeatherService, cities: List[Dict[str, Any]]) -> str:
+    """Fetch current weather for a list of cities and format one combined result
+    
+    Cities found in the offline index are fetched by ID through the group
+    endpoint; any that cannot be resolved fall back to individual name queries.
+    """
+    entries = []
+    for entry in cities:
+        city, state = entry.get("city"), entry.get("state")
+        label = f"{city}, {state}" if state else f"{city}"
+        record = weather_service.resolve_city(city, state) if city else None
+        entries.append((label, city, state, record.id if record else None))
+    
+    city_ids = list(dict.fromkeys(city_id for _, _, _, city_id in entries if city_id is not None))
+    
+    async def fetch_by_ids():
+        return await weather_service.get_current_weather_group(city_ids) if city_ids else {}
+    
+    async def fetch_by_name(city: str, state: Optional[str]):
+        try:
+            return await weather_service.get_current_weather(city, state)
+        except Exception as e:
+            return str(e)
+    
+    unresolved = [(label, city, state) for label, city, state, city_id in entries if city_id is None and city]
+    by_id, by_name = await asyncio.gather(
+        fetch_by_ids(),
+        asyncio.gather(*(fetch_by_name(city, state) for _, city, state in unresolved)),
+    )
+    by_label = {label: data for (label, _, _), data in zip(unresolved, by_name)}
+    
+    results = []
+    for label, city, _, city_id in entries:
+        if not city:
+            results.append((label, "City name is required"))
+        elif city_id is not None:
+            results.append((label, by_id.get(city_id, "No data returned for this city")))
+        else:
+            results.append((label, by_label[label]))
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        return format_bulk_weather(results)
+
+class ToolSpec:
+    """A registered tool: its MCP definition, argument validator and handler
+    
+    The validator is compiled on the tool's first call rather than at import,
+    so spawning the server and answering list_tools does no schema work.
+    """
+    
+    __slots__ = ("definition", "handler", "_validator")
+    
+    def __init__(self, definition: types.Tool, handler: Callable[..., Awaitable[Any]]):
+        self.definition = definition
+        self.handler = handler
+        self._validator = None
+    
+    @property
+    def validator(self) -> Any:
+        if self._validator is None:
+            import jsonschema
+            
+            schema = self.definition.inputSchema
+            validator_cls = jsonschema.validators.validator_for(schema)
+            validator_cls.check_schema(schema)
+            self._validator = validator_cls(schema)
+        return self._validator
+
+# Tool registry: name -> ToolSpec, filled by the @register_tool decorators below
+TOOLS: Dict[str, ToolSpec] = {}
+# Precomputed list_tools response, rebuilt only when a tool is registered
+_tool_definitions: List[types.Tool] = []
+
+def register_tool(name: str, description: str, input_schema: Dict[str, Any]):
+    """Register a tool handler together with its input schema
+    
+    The schema's validator is compiled once, on the first call, so later
+    calls only run the validation itself. Handlers receive the shared
+    WeatherService and the already-validated arguments.
+    """
+    def decorator(handler: Callable[..., Awaitable[Any]]):
+        definition = types.Tool(name=name, description=description, inputSchema=input_schema)
+        TOOLS[name] = ToolSpec(definition, handler)
+        _tool_definitions[:] = [tool.definition for tool in TOOLS.values()]
+        return handler
+    
+    return decorator
+
+CITY_PROPERTY = {
+    "type": "string",
+    "minLength": 1,
+    "description": "The city name (e.g., 'New York', 'Los Angeles')"
+}
+
+STATE_PROPERTY = {
+    "type": "string",
+    "description": "The state abbreviation (e.g., 'NY', 'CA') - optional but recommended for accuracy"
+}
+
+@register_tool(
+    name="get_current_weather",
+    description="Get current weather conditions for a US city",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "city": CITY_PROPERTY,
+            "state": STATE_PROPERTY
+        },
+        "required": ["city"]
+    }
+)
+async def current_weather_tool(weather_service: WeatherService, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    weather_data = await weather_service.get_current_weather(arguments["city"], arguments.get("state"))
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        formatted_weather = format_current_weather(weather_data)
+    
+    return [types.TextContent(
+        type="text",
+        text=formatted_weather
+    )]
+
+@register_tool(
+    name="get_current_weather_bulk",
+    description="Get current weather conditions for many US cities at once (e.g. for dashboards)",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "cities": {
+                "type": "array",
+                "description": "The cities to look up",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "city": CITY_PROPERTY,
+                        "state": STATE_PROPERTY
                     },
-                    "state": {
-                        "type": "string",
-                        "description": "The state abbreviation (e.g., 'NY', 'CA') - optional but recommended for accuracy"
-                    }
+                    "required": ["city"]
                 },
-                "required": ["city"]
+                "minItems": 1
             }
-        ),
-        types.Tool(
-            name="get_weather_forecast",
-            description="Get weather forecast for a US city (up to 5 days)",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city name (e.g., 'New York', 'Los Angeles')"
-                    },
-                    "state": {
-                        "type": "string",
-                        "description": "The state abbreviation (e.g., 'NY', 'CA') - optional but recommended for accuracy"
-                    },
-                    "days": {
-                        "type": "integer",
-                        "description": "Number of days to forecast (1-5, default: 5)",
-                        "minimum": 1,
-                        "maximum": 5
-                    }
-                },
-                "required": ["city"]
+        },
+        "required": ["cities"]
+    }
+)
+async def current_weather_bulk_tool(weather_service: WeatherService, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    formatted_bulk = await get_bulk_weather(weather_service, arguments["cities"])
+    
+    return [types.TextContent(
+        type="text",
+        text=formatted_bulk
+    )]
+
+@register_tool(
+    name="get_weather_forecast",
+    description="Get weather forecast for a US city (up to 5 days)",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "city": CITY_PROPERTY,
+            "state": STATE_PROPERTY,
+            "days": {
+                "type": "integer",
+                "description": "Number of days to forecast (1-5, default: 5)",
+                "minimum": 1,
+                "maximum": 5
+            },
+            "format": {
+                "type": "string",
+                "description": "Output format: 'text' (default) for a readable summary, 'json' for structured daily data",
+                "enum": ["text", "json"]
             }
-        )
-    ]
+        },
+        "required": ["city"]
+    }
+)
+async def weather_forecast_tool(weather_service: WeatherService, arguments: Dict[str, Any]) -> Union[List[types.TextContent], Dict[str, Any]]:
+    days = arguments.get("days", 5)
+    forecast_data = await weather_service.get_forecast(arguments["city"], arguments.get("state"))
+    
+    with metrics.timer("stage_duration_seconds", stage="format"):
+        if arguments.get("format") == "json":
+            # Returned as structured content; the server also adds its JSON text rendering
+            return aggregate_forecast(forecast_data, days)
+        
+        formatted_forecast = format_forecast(forecast_data, days)
+    
+    return [types.TextContent(
+        type="text",
+        text=formatted_forecast
+    )]
+
+@server.list_tools()
+async def handle_list_tools() -> List[types.Tool]:
+    """List available weather tools"""
+    return _tool_definitions
 
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+# Arguments are validated against the precompiled validators in TOOLS, so the
+# SDK's own per-call schema validation is turned off
+@server.call_tool(validate_input=False)
+async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> Union[List[types.TextContent], Dict[str, Any]]:
     """Handle tool calls"""
     if not OPENWEATHER_API_KEY:
         return [types.TextContent(
@@ -195,50 +807,28 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.T
             text="Error: OpenWeatherMap API key not configured. Please set the OPENWEATHER_API_KEY environment variable."
         )]
     
+    tool = TOOLS.get(name)
+    if tool is None:
+        metrics.inc("errors_total", scope="tool", type="UnknownTool")
+        return [types.TextContent(
+            type="text",
+            text=f"Error: Unknown tool '{name}'"
+        )]
+    
+    from jsonschema.exceptions import best_match  # deferred to the first call, see ToolSpec.validator
+    
+    arguments = arguments or {}
+    error = best_match(tool.validator.iter_errors(arguments))
+    if error is not None:
+        metrics.inc("errors_total", scope="tool", type="InvalidArguments")
+        return [types.TextContent(
+            type="text",
+            text=f"Error: Invalid arguments for '{name}': {error.message}"
+        )]
+    
     try:
-        async with WeatherService(OPENWEATHER_API_KEY) as weather_service:
-            if name == "get_current_weather":
-                city = arguments.get("city")
-                state = arguments.get("state")
-                
-                if not city:
-                    return [types.TextContent(
-                        type="text",
-                        text="Error: City name is required"
-                    )]
-                
-                weather_data = await weather_service.get_current_weather(city, state)
-                formatted_weather = format_current_weather(weather_data)
-                
-                return [types.TextContent(
-                    type="text",
-                    text=formatted_weather
-                )]
-            
-            elif name == "get_weather_forecast":
-                city = arguments.get("city")
-                state = arguments.get("state")
-                days = arguments.get("days", 5)
-                
-                if not city:
-                    return [types.TextContent(
-                        type="text",
-                        text="Error: City name is required"
-                    )]
-                
-                forecast_data = await weather_service.get_forecast(city, state, days)
-                formatted_forecast = format_forecast(forecast_data)
-                
-                return [types.TextContent(
-                    type="text",
-                    text=formatted_forecast
-                )]
-            
-            else:
-                return [types.TextContent(
-                    type="text",
-                    text=f"Error: Unknown tool '{name}'"
-                )]
+        with metrics.track("tool", tool=name):
+            return await tool.handler(get_weather_service(), arguments)
     
     except Exception as e:
         logger.error(f"Error in tool '{name}': {str(e)}")
@@ -247,8 +837,40 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.T
             text=f"Error: {str(e)}"
         )]
 
+# Metrics resources: a JSON snapshot with latency percentiles, and the Prometheus text format
+METRICS_RESOURCES = [
+    types.Resource(
+        uri="weather://metrics",
+        name="metrics",
+        description="Tool and upstream latency percentiles, in-flight requests, errors by type and cache hit ratios",
+        mimeType="application/json",
+    ),
+    types.Resource(
+        uri="weather://metrics/prometheus",
+        name="metrics_prometheus",
+        description="All server metrics in the Prometheus text exposition format",
+        mimeType="text/plain",
+    ),
+]
+
+@server.list_resources()
+async def handle_list_resources() -> List[types.Resource]:
+    """List the metrics resources"""
+    return METRICS_RESOURCES
+
+@server.read_resource()
+async def handle_read_resource(uri: AnyUrl) -> List[ReadResourceContents]:
+    """Render metrics on demand"""
+    if str(uri) == "weather://metrics":
+        return [ReadResourceContents(json.dumps(metrics.snapshot(), indent=2), "application/json")]
+    if str(uri) == "weather://metrics/prometheus":
+        return [ReadResourceContents(metrics.render_prometheus(), "text/plain; version=0.0.4")]
+    raise ValueError(f"Unknown resource: {uri}")
+
 async def main():
     """Main function to run the MCP server"""
+    # Configured here rather than at import so importing the module has no side effects
+    logging.basicConfig(level=logging.INFO)
     # Server capabilities
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await server.run(
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Stale-while-revalidate cache for the US Weather Assistant MCP Server
+
+Weather responses are cached in-process, keyed by endpoint and resolved
+location. Fresh entries are served directly. Entries past their TTL but
+still inside the stale window are served immediately while a background
+task refreshes them. Anything older is fetched before returning.
+Concurrent misses for the same key share one upstream request.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger("weather-server")
+
+Fetcher = Callable[[], Awaitable[Any]]
+
+
+class CacheEntry:
+    """A cached value together with its freshness deadlines (monotonic seconds)"""
+
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class WeatherCache:
+    """Bounded LRU cache with stale-while-revalidate semantics"""
+
+    def __init__(self, max_entries: int = 512, max_stale: float = 3600):
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Return the entry if it is still servable (fresh or stale), marking it recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.stale_until:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def peek(self, key: Hashable) -> Optional[CacheEntry]:
+        """Return the entry without touching LRU order or hit statistics"""
+        return self._entries.get(key)
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value, now + ttl, now + ttl + self.max_stale)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, key: Hashable, ttl: float, fetch: Fetcher) -> Any:
+        """Serve ``key`` from cache, refreshing stale entries in the background"""
+        entry = self.get(key)
+        if entry is not None:
+            if time.monotonic() < entry.fresh_until:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self.refresh(key, ttl, fetch)
+            return entry.value
+
+        self.misses += 1
+        return await self._fetch(key, ttl, fetch)
+
+    def refresh(self, key: Hashable, ttl: float, fetch: Fetcher) -> asyncio.Task:
+        """Start a background refresh for ``key`` unless one is already running"""
+        return self._start_fetch(key, ttl, fetch)
+
+    async def _fetch(self, key: Hashable, ttl: float, fetch: Fetcher) -> Any:
+        """Fetch ``key`` upstream, sharing one request between concurrent callers
+
+        The request runs as its own task, so a caller being cancelled does not
+        cancel it for the other waiters.
+        """
+        return await asyncio.shield(self._start_fetch(key, ttl, fetch))
+
+    def _start_fetch(self, key: Hashable, ttl: float, fetch: Fetcher) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key, ttl, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        return task
+
+    async def _fetch_and_store(self, key: Hashable, ttl: float, fetch: Fetcher) -> Any:
+        value = await fetch()
+        self.set(key, value, ttl)
+        return value
+
+    def _fetch_done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so failed background refreshes are logged, not warned about
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Weather fetch failed for {key}: {task.exception()}")
+
+    async def close(self):
+        """Cancel any upstream fetches still running"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+        }
@@ -1,21 +1,37 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, List
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, List, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
-from models import User, TokenData, PermissionEnum, RoleEnum, ROLE_PERMISSIONS
+from hashing import HasherBusy, PasswordHasher
+from models import (
+    User, TokenData, PermissionEnum, RoleEnum, PERMISSION_BITS, ROLE_BITS, ROLE_MASKS,
+    CLAIM_VERSION, PERMISSION_CLAIM_LAYOUTS, ROLE_CLAIM_LAYOUTS, permissions_to_mask,
+)
+from revocation import RevocationList
+from users import SQLiteUserRepository, UserCache
 
 # 配置
 SECRET_KEY = "your-secret-key-here"  # 在生产环境中应该使用环境变量
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = 4096  # 已验证令牌缓存的最大条目数
+MAX_TOKEN_LIFETIME = timedelta(days=1)  # 令牌最长有效期，也是按用户撤销时条目的保留时长
 
 # 密码加密
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 请求路径上的哈希计算都交给专用线程池，不阻塞事件循环
+password_hasher = PasswordHasher(pwd_context)
 
-# 模拟用户数据库
-fake_users_db = {
-    "admin": {
+# 演示用户，首次连接用户库时写入（已存在的用户名跳过）
+DEMO_USERS = [
+    {
         "id": 1,
         "username": "admin",
         "email": "admin@example.com",
@@ -24,7 +40,7 @@ fake_users_db = {
         "is_active": True,
         "created_at": datetime.now()
     },
-    "developer": {
+    {
         "id": 2,
         "username": "developer",
         "email": "dev@example.com",
@@ -33,7 +49,7 @@ fake_users_db = {
         "is_active": True,
         "created_at": datetime.now()
     },
-    "user": {
+    {
         "id": 3,
         "username": "user",
         "email": "user@example.com",
@@ -42,7 +58,7 @@ fake_users_db = {
         "is_active": True,
         "created_at": datetime.now()
     },
-    "data_steward": {
+    {
         "id": 4,
         "username": "data_steward",
         "email": "data@example.com",
@@ -51,7 +67,10 @@ fake_users_db = {
         "is_active": True,
         "created_at": datetime.now()
     }
-}
+]
+
+# 用户存储：SQLite 持久化；每个请求读取的 User 对象经 user_cache 缓存
+user_repository = SQLiteUserRepository(seed_users=DEMO_USERS)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
@@ -61,69 +80,289 @@ def get_password_hash(password: str) -> str:
     """生成密码哈希"""
     return pwd_context.hash(password)
 
-def get_user(username: str) -> Optional[dict]:
-    """获取用户信息"""
-    if username in fake_users_db:
-        return fake_users_db[username]
-    return None
+async def get_user(username: str) -> Optional[dict]:
+    """获取用户信息（含密码哈希，直接读用户库）"""
+    return await user_repository.get_by_username(username)
 
-def authenticate_user(username: str, password: str) -> Optional[dict]:
-    """验证用户身份"""
-    user = get_user(username)
+async def authenticate_user(username: str, password: str) -> Optional[dict]:
+    """验证用户身份（bcrypt 校验在线程池中执行）"""
+    user = await get_user(username)
     if not user:
         return None
-    if not verify_password(password, user["hashed_password"]):
+    try:
+        verified = await password_hasher.verify(password, user["hashed_password"])
+    except HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts, please retry",
+            headers={"Retry-After": "1"},
+        )
+    if not verified:
         return None
     return user
 
+@lru_cache(maxsize=256)
+def _roles_mask(roles: Tuple[RoleEnum, ...]) -> int:
+    mask = 0
+    for role in roles:
+        mask |= ROLE_MASKS.get(role, 0)
+    return mask
+
+def get_permission_mask(roles: Iterable[RoleEnum]) -> int:
+    """根据角色获取权限位掩码（按角色组合缓存）"""
+    return _roles_mask(tuple(roles))
+
+def has_permission(mask: int, permission: PermissionEnum) -> bool:
+    """判断掩码中是否包含某个权限"""
+    return mask & PERMISSION_BITS[permission] != 0
+
+@lru_cache(maxsize=256)
+def mask_to_permissions(mask: int) -> Tuple[PermissionEnum, ...]:
+    """把位掩码还原为权限元组"""
+    return tuple(permission for permission, bit in PERMISSION_BITS.items() if mask & bit)
+
 def get_user_permissions(roles: List[RoleEnum]) -> List[PermissionEnum]:
     """根据角色获取用户权限"""
-    permissions = set()
-    for role in roles:
-        if role == RoleEnum.SUPER_ADMIN:
-            # 超级管理员拥有所有权限
-            return list(PermissionEnum)
-        role_permissions = ROLE_PERMISSIONS.get(role, [])
-        permissions.update(role_permissions)
-    return list(permissions)
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """创建访问令牌"""
+    return list(mask_to_permissions(get_permission_mask(roles)))
+
+def _bits_to_mask(names: Iterable[Any], bits: Dict[Any, int]) -> int:
+    mask = 0
+    for name in names:
+        mask |= bits.get(name, 0)
+    return mask
+
+@lru_cache(maxsize=256)
+def _decode_claim_mask(mask: int, layout: Tuple[str, ...], current: Tuple[str, ...], bits_name: str) -> int:
+    """把旧版本布局的掩码转换为当前位布局，当前版本直接返回"""
+    if layout == current:
+        return mask
+    bits = PERMISSION_BITS if bits_name == "permission" else ROLE_BITS
+    return _bits_to_mask((name for i, name in enumerate(layout) if mask >> i & 1), bits)
+
+def encode_permission_claims(permissions: Iterable[Any] = (), roles: Iterable[Any] = ()) -> Dict[str, int]:
+    """把权限和角色编码为紧凑声明：pv 版本号，pm 权限掩码，rm 角色掩码"""
+    return {
+        "pv": CLAIM_VERSION,
+        "pm": permissions_to_mask(permissions),
+        "rm": _bits_to_mask(roles, ROLE_BITS),
+    }
+
+def decode_permission_claims(payload: Dict[str, Any]) -> Tuple[int, int]:
+    """从令牌载荷中解出（显式权限掩码，角色掩码），兼容紧凑格式和权限字符串列表"""
+    if "pv" not in payload:
+        return (
+            permissions_to_mask(payload.get("permissions", [])),
+            _bits_to_mask(payload.get("roles", []), ROLE_BITS),
+        )
+    version = payload["pv"]
+    if version not in PERMISSION_CLAIM_LAYOUTS:
+        raise ValueError(f"Unsupported permission claim version: {version}")
+    return (
+        _decode_claim_mask(int(payload.get("pm", 0)), PERMISSION_CLAIM_LAYOUTS[version], PERMISSION_CLAIM_LAYOUTS[CLAIM_VERSION], "permission"),
+        _decode_claim_mask(int(payload.get("rm", 0)), ROLE_CLAIM_LAYOUTS[version], ROLE_CLAIM_LAYOUTS[CLAIM_VERSION], "role"),
+    )
+
+@lru_cache(maxsize=256)
+def _role_mask_to_permission_mask(role_mask: int) -> int:
+    return _roles_mask(tuple(role for role, bit in ROLE_BITS.items() if role_mask & bit))
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, compact: bool = False):
+    """
+    创建访问令牌。
+
+    compact=True 时 permissions 和 roles 编码为整数掩码声明，令牌更短、解析更快；
+    verify_token 同时接受两种格式。有效期不超过 MAX_TOKEN_LIFETIME，
+    保证按用户撤销的条目不会早于令牌过期而被清理。
+    """
     to_encode = data.copy()
+    if compact:
+        to_encode.update(encode_permission_claims(to_encode.pop("permissions", ()), to_encode.pop("roles", ())))
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.utcnow() + min(expires_delta, MAX_TOKEN_LIFETIME)
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    # jti 和 iat 用于撤销：按 jti 撤销单个令牌，按签发时间撤销某用户之前的全部令牌
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    to_encode.setdefault("iat", int(time.time() * 1000) / 1000)  # 向下取整到毫秒，不会晚于实际签发时刻
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> TokenData:
-    """验证令牌"""
-    credentials_exception = HTTPException(
+class VerifiedToken:
+    """一个已通过验证的令牌：解析结果、过期时间和撤销检查所需的 jti、签发时间"""
+
+    __slots__ = ("token_data", "expires_at", "jti", "issued_at")
+
+    def __init__(self, token_data: TokenData, expires_at: float, jti: Optional[str] = None, issued_at: float = 0.0):
+        self.token_data = token_data
+        self.expires_at = expires_at
+        self.jti = jti
+        self.issued_at = issued_at  # 旧令牌没有 iat，视为最早签发，按用户撤销时一并失效
+
+class TokenCache:
+    """
+    已验证令牌的 LRU 缓存。
+
+    同一个令牌在过期前会被反复使用，命中缓存时可以跳过 JWT 解码、HMAC 校验和模型构建。
+    以令牌的 SHA-256 摘要为键，条目在令牌的 exp 时刻失效；用户或令牌被撤销时需显式失效。
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, VerifiedToken]" = OrderedDict()
+        self._by_user: Dict[str, Set[bytes]] = {}
+        self._lock = threading.Lock()  # 同步依赖运行在线程池中
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[VerifiedToken]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, token: str, entry: VerifiedToken) -> None:
+        key = self._key(token)
+        username = entry.token_data.username
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._by_user.setdefault(username, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry.token_data.username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry.token_data.username]
+
+    def invalidate(self, token: str) -> None:
+        """使单个令牌的缓存失效"""
+        with self._lock:
+            self._remove(self._key(token))
+
+    def invalidate_user(self, username: str) -> None:
+        """使某个用户所有令牌的缓存失效（如角色变更、账号禁用）"""
+        with self._lock:
+            for key in list(self._by_user.get(username, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+token_cache = TokenCache()
+revocation_list = RevocationList()
+user_cache = UserCache(user_repository)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _verify(token: str) -> VerifiedToken:
+    """验证令牌，优先使用缓存；缓存命中时同样检查撤销列表"""
+    entry = token_cache.get(token)
+    if entry is None:
+        entry = _decode(token)
+    if revocation_list.is_revoked(entry.jti, entry.token_data.username, entry.issued_at):
+        raise _credentials_exception()
+    return entry
+
+def _decode(token: str) -> VerifiedToken:
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        permissions: List[str] = payload.get("permissions", [])
-        token_data = TokenData(username=username, permissions=permissions)
-    except JWTError:
+        explicit_mask, role_mask = decode_permission_claims(payload)
+        if "pv" in payload:
+            permissions: List[str] = [permission.value for permission in mask_to_permissions(explicit_mask)]
+        else:
+            permissions = payload.get("permissions", [])
+        token_data = TokenData(
+            username=username,
+            permissions=permissions,
+            permission_mask=explicit_mask | _role_mask_to_permission_mask(role_mask),
+        )
+    except (JWTError, ValueError):
         raise credentials_exception
-    return token_data
+    entry = VerifiedToken(token_data, float(payload.get("exp", 0)), payload.get("jti"), float(payload.get("iat", 0)))
+    # 没有 exp 的令牌不缓存，以免永不过期
+    if "exp" in payload:
+        token_cache.put(token, entry)
+    return entry
 
-def get_current_user(token: str) -> User:
-    """获取当前用户"""
+def verify_token(token: str) -> TokenData:
+    """验证令牌"""
+    return _verify(token).token_data
+
+async def get_current_user(token: str) -> User:
+    """获取当前用户（经 User 缓存读取）"""
     token_data = verify_token(token)
-    user = get_user(username=token_data.username)
+    user = await user_cache.get(token_data.username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return User(**user)
+    return user
+
+def revoke_token(token: str) -> None:
+    """撤销单个令牌（需要令牌带 jti；已过期或无效的令牌无需撤销）"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+    # 没有 jti 或 exp 的令牌无法按 jti 撤销到过期为止，只能撤销该用户的全部令牌
+    missing = [claim for claim in ("jti", "exp") if claim not in payload]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Token has no {' or '.join(missing)} claim; revoke the user's tokens instead",
+        )
+    revocation_list.revoke_token(payload["jti"], float(payload["exp"]))
+    token_cache.invalidate(token)
+
+def revoke_user_tokens(username: str) -> None:
+    """撤销用户此前签发的所有令牌"""
+    now = time.time()
+    revocation_list.revoke_user(username, now, now + MAX_TOKEN_LIFETIME.total_seconds())
+    token_cache.invalidate_user(username)
+
+async def set_user_roles(username: str, roles: List[RoleEnum]) -> bool:
+    """
+    修改用户角色，并使该用户的 User 缓存失效。
+
+    令牌中的权限和角色声明在签发时就已固定，只清缓存的话旧令牌解出的仍是旧权限，
+    因此同时撤销该用户此前签发的全部令牌，用户需要重新登录以获得新角色的令牌。
+    撤销列表经文件在 worker 之间共享，其他 worker 也会拒绝这些旧令牌。
+    """
+    updated = await user_cache.set_roles(username, roles)
+    if updated:
+        revoke_user_tokens(username)
+    return updated
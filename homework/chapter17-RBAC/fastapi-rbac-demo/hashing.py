@@ -0,0 +1,104 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+from passlib.context import CryptContext
+
+# bcrypt 在专用线程池中执行，避免阻塞事件循环。
+#
+# bcrypt 的 C 实现计算时会释放 GIL，所以线程池即可并行利用多核。
+# 线程数限制了同时进行的哈希数量，排队数超过上限时直接拒绝，
+# 登录高峰只会让登录请求失败，而不会拖慢持有令牌的正常请求。
+
+HASH_WORKERS = min(4, os.cpu_count() or 1)  # 同时进行的哈希计算数
+HASH_MAX_QUEUE = 64  # 等待线程的最大请求数
+
+T = TypeVar("T")
+
+class HasherBusy(Exception):
+    """哈希线程池排队已满"""
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希和校验，提供异步接口"""
+
+    def __init__(self, context: CryptContext, workers: int = HASH_WORKERS, max_queue: int = HASH_MAX_QUEUE):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0  # 已提交但未完成的任务（运行中 + 排队中）
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.pending - self.running
+
+    def _timed(self, submitted: float, func: Callable[..., T], *args) -> T:
+        """在工作线程中运行，并记录计算耗时和排队耗时"""
+        with self._lock:
+            self.running += 1
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.hash_seconds += finished - started
+                self.wait_seconds += started - submitted
+
+    def _finished(self, _: Future) -> None:
+        # 任务运行结束或在排队中被取消时才释放名额；调用方被取消不会提前释放
+        with self._lock:
+            self.pending -= 1
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HasherBusy("Too many concurrent password checks")
+            self.pending += 1
+            # 超出线程数的任务需要排队
+            self.peak_queue_depth = max(self.peak_queue_depth, self.pending - self.workers)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        future = self._executor.submit(self._timed, time.perf_counter(), func, *args)
+        future.add_done_callback(self._finished)
+        # 调用方被取消时，尚在排队的任务随之取消，已在运行的任务继续占用名额直到结束
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """异步校验密码"""
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        """异步生成密码哈希"""
+        return await self._run(self.context.hash, password)
+
+    def stats(self) -> Dict[str, float]:
+        """队列深度、拒绝次数和平均耗时"""
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_hash_seconds": self.hash_seconds / self.completed if self.completed else 0.0,
+            "avg_wait_seconds": self.wait_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -81,6 +81,42 @@ ROLE_PERMISSIONS = {
     ],
 }
 
+# 权限位掩码：每个权限占一位，导入时一次性算好每个角色的掩码，
+# 运行时的权限判断只需一次按位与
+PERMISSION_BITS = {permission: 1 << i for i, permission in enumerate(PermissionEnum)}
+ALL_PERMISSIONS_MASK = (1 << len(PermissionEnum)) - 1
+
+def permissions_to_mask(permissions) -> int:
+    """把权限列表编码为位掩码（未知权限忽略）"""
+    mask = 0
+    for permission in permissions:
+        bit = PERMISSION_BITS.get(permission)
+        if bit is not None:
+            mask |= bit
+    return mask
+
+ROLE_MASKS = {role: permissions_to_mask(permissions) for role, permissions in ROLE_PERMISSIONS.items()}
+# 超级管理员拥有所有权限
+ROLE_MASKS[RoleEnum.SUPER_ADMIN] = ALL_PERMISSIONS_MASK
+ROLE_BITS = {role: 1 << i for i, role in enumerate(RoleEnum)}
+
+# 紧凑令牌中权限/角色掩码的位布局，按版本冻结：已签发的令牌按其版本解码，
+# 调整枚举顺序或删除成员时必须新增一个版本，而不是修改旧布局
+CLAIM_VERSION = 1
+PERMISSION_CLAIM_LAYOUTS = {
+    1: (
+        "execute_agent", "view_history", "create_agent", "edit_agent", "test_agent", "submit_agent",
+        "read_data", "approve_agent", "publish_agent", "manage_users", "manage_roles", "monitor_system",
+        "manage_models", "manage_data_access", "audit_data_access", "revoke_access", "full_access",
+    ),
+}
+ROLE_CLAIM_LAYOUTS = {
+    1: ("end_user", "developer", "administrator", "data_steward", "super_admin"),
+}
+# 当前版本的布局与内存中的位布局一致，编码时无需转换
+assert PERMISSION_CLAIM_LAYOUTS[CLAIM_VERSION] == tuple(PermissionEnum)
+assert ROLE_CLAIM_LAYOUTS[CLAIM_VERSION] == tuple(RoleEnum)
+
 # Pydantic 模型
 class User(BaseModel):
     id: int
@@ -107,4 +143,5 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
     permissions: List[str] = []
+    permission_mask: int = 0
 
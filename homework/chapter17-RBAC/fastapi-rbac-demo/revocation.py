@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，退化为单进程使用
+    fcntl = None
+
+# 令牌撤销列表。
+#
+# 可以按 jti 撤销单个令牌，也可以撤销某个用户在某时刻之前签发的全部令牌。
+# 每个请求都要检查，所以前面放一个布隆过滤器：绝大多数未撤销的令牌只需几次位运算即可放行，
+# 过滤器命中时再查精确集合确认。条目保留到对应令牌本身过期为止，之后自动清理。
+# 列表持久化到本地 JSON 文件，重启后仍然有效。同一主机上的多个 worker 共享这个文件：
+# 写入时持有文件锁，先读出磁盘上的内容与本地合并（取并集）再原子替换，不会覆盖其他 worker 的撤销；
+# 各 worker 定期检查文件变化并把新条目合并进来。
+
+REVOCATION_FILE = "revoked_tokens.json"
+REVOCATION_CAPACITY = 10000  # 布隆过滤器的初始容量，超出后清理时按两倍重建
+REVOCATION_SYNC_INTERVAL = 5  # 秒，检查过期条目和文件变化的间隔
+
+class BloomFilter:
+    """固定大小的布隆过滤器，约 1% 误判率"""
+
+    BITS_PER_ITEM = 10
+    HASHES = 7
+
+    def __init__(self, capacity: int):
+        self.size = max(64, capacity * self.BITS_PER_ITEM)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _hashes(self, key: str) -> Tuple[int, int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, key: str) -> None:
+        h1, h2 = self._hashes(key)
+        for i in range(self.HASHES):
+            position = (h1 + i * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        # 未撤销的键通常在第一个位置就能排除
+        h1, h2 = self._hashes(key)
+        bits, size = self.bits, self.size
+        for i in range(self.HASHES):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class RevocationList:
+    """按 jti 或“用户 + 签发时间”撤销令牌"""
+
+    def __init__(self, path: Optional[str] = REVOCATION_FILE, capacity: int = REVOCATION_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._tokens: Dict[str, float] = {}  # jti -> 令牌过期时间
+        self._users: Dict[str, Tuple[float, float]] = {}  # 用户名 -> (签发时间上限, 条目过期时间)
+        self._bloom = BloomFilter(capacity)
+        self._lock = threading.Lock()
+        self._file_version: Optional[Tuple[int, int]] = None  # 上次读写时文件的 (inode, mtime)
+        self._next_sync = 0.0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+    def _rebuild(self) -> None:
+        """布隆过滤器不支持删除，清理过期条目后整体重建"""
+        while len(self) > self.capacity:
+            self.capacity *= 2
+        bloom = BloomFilter(self.capacity)
+        for jti in self._tokens:
+            bloom.add("jti:" + jti)
+        for username in self._users:
+            bloom.add("user:" + username)
+        self._bloom = bloom
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """跨进程的写锁，使用旁边的 .lock 文件"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _current_version(self) -> Optional[Tuple[int, int]]:
+        # 每次写入都用 os.replace 换成新文件，inode 变化比 mtime 更可靠
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_file(self) -> Tuple[Dict[str, float], Dict[str, Tuple[float, float]]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        tokens = {jti: float(exp) for jti, exp in data.get("tokens", {}).items()}
+        users = {user: (float(cutoff), float(exp)) for user, (cutoff, exp) in data.get("users", {}).items()}
+        return tokens, users
+
+    def _merge(self, tokens: Dict[str, float], users: Dict[str, Tuple[float, float]]) -> None:
+        """并入另一份撤销列表：同一 jti 取较晚的过期时间，同一用户取较晚的签发时间上限和过期时间"""
+        for jti, exp in tokens.items():
+            if jti not in self._tokens:
+                self._bloom.add("jti:" + jti)
+            self._tokens[jti] = max(exp, self._tokens.get(jti, 0.0))
+        for user, (cutoff, exp) in users.items():
+            if user not in self._users:
+                self._bloom.add("user:" + user)
+            old_cutoff, old_exp = self._users.get(user, (0.0, 0.0))
+            self._users[user] = (max(cutoff, old_cutoff), max(exp, old_exp))
+
+    def _drop_expired(self, now: float) -> bool:
+        expired_tokens = [jti for jti, exp in self._tokens.items() if exp <= now]
+        expired_users = [user for user, (_, exp) in self._users.items() if exp <= now]
+        for jti in expired_tokens:
+            del self._tokens[jti]
+        for user in expired_users:
+            del self._users[user]
+        return bool(expired_tokens or expired_users)
+
+    def _load(self) -> None:
+        """把文件中的条目合并进内存"""
+        if not self.path:
+            return
+        self._file_version = self._current_version()
+        if self._file_version is None:
+            return
+        self._merge(*self._read_file())
+        if self._drop_expired(time.time()) or len(self) > self.capacity:
+            self._rebuild()
+
+    def _save(self) -> None:
+        """持锁读出磁盘上的最新内容，与本地合并后原子替换"""
+        expired = False
+        if self.path:
+            with self._file_lock():
+                self._merge(*self._read_file())
+                expired = self._drop_expired(time.time())
+                self._write()
+        # 布隆过滤器不支持删除，有条目过期或超出容量（误判率迅速上升）时整体重建
+        if expired or len(self) > self.capacity:
+            self._rebuild()
+
+    def _write(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"tokens": self._tokens, "users": self._users}, f)
+        os.replace(tmp_path, self.path)
+        self._file_version = self._current_version()
+
+    def _sync(self, now: float) -> None:
+        """合并其他 worker 写入的条目，并清理过期条目"""
+        with self._lock:
+            self._next_sync = now + REVOCATION_SYNC_INTERVAL
+            if self.path and self._current_version() != self._file_version:
+                self._load()
+            elif self._drop_expired(now):
+                # 过期条目只在本地清理；文件中的过期条目在下次写入时一并丢弃
+                self._rebuild()
+
+    def revoke_token(self, jti: str, expires_at: float) -> None:
+        """撤销单个令牌，条目保留到令牌过期"""
+        with self._lock:
+            self._tokens[jti] = max(expires_at, self._tokens.get(jti, 0.0))
+            self._bloom.add("jti:" + jti)
+            self._save()
+
+    def revoke_user(self, username: str, issued_before: float, expires_at: float) -> None:
+        """撤销用户在 issued_before 及之前签发的所有令牌，条目保留到 expires_at"""
+        with self._lock:
+            cutoff, exp = self._users.get(username, (0.0, 0.0))
+            self._users[username] = (max(cutoff, issued_before), max(exp, expires_at))
+            self._bloom.add("user:" + username)
+            self._save()
+
+    def is_revoked(self, jti: Optional[str], username: str, issued_at: float) -> bool:
+        """O(1) 检查：布隆过滤器未命中即可放行，命中后查精确集合"""
+        now = time.time()
+        if now >= self._next_sync:
+            self._sync(now)
+        if jti is not None and "jti:" + jti in self._bloom:
+            exp = self._tokens.get(jti)
+            if exp is not None and exp > now:
+                return True
+        if "user:" + username in self._bloom:
+            entry = self._users.get(username)
+            if entry is not None and entry[1] > now and issued_at <= entry[0]:
+                return True
+        return False
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from hashing import HasherBusy, PasswordHasher
+
+class BlockingContext:
+    """替代 CryptContext：verify 一直阻塞到测试放行"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        self.started.set()
+        self.release.wait(5)
+        return plain_password == hashed_password
+
+    def hash(self, password: str) -> str:
+        return password
+
+def test_cancelled_verify_keeps_its_slot_until_the_job_ends():
+    context = BlockingContext()
+    hasher = PasswordHasher(context, workers=1, max_queue=1)
+
+    async def check():
+        running = asyncio.create_task(hasher.verify("a", "a"))
+        await asyncio.get_running_loop().run_in_executor(None, context.started.wait, 5)
+        queued = asyncio.create_task(hasher.verify("b", "b"))
+        await asyncio.sleep(0)
+        assert hasher.pending == 2 and hasher.peak_queue_depth == 1
+
+        # 运行中的任务无法中断，调用方被取消后仍然占用名额
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        assert hasher.pending == 2
+        with pytest.raises(HasherBusy):
+            await hasher.verify("c", "c")
+
+        # 排队中的任务随调用方一起取消，名额立即释放
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert hasher.pending == 1
+        waiting = asyncio.create_task(hasher.verify("d", "d"))
+        await asyncio.sleep(0)
+
+        context.release.set()
+        assert await waiting
+        assert hasher.pending == 0 and hasher.running == 0
+        assert hasher.stats()["completed"] == 2
+        assert hasher.rejected == 1
+
+    try:
+        asyncio.run(check())
+    finally:
+        context.release.set()
+        hasher.shutdown()
+
+def test_sequential_calls_do_not_count_as_queued():
+    context = BlockingContext()
+    context.release.set()
+    hasher = PasswordHasher(context, workers=2)
+
+    async def check():
+        for _ in range(3):
+            assert await hasher.verify("a", "a")
+
+    asyncio.run(check())
+    hasher.shutdown()
+    assert hasher.peak_queue_depth == 0
+    assert hasher.stats()["completed"] == 3
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+import auth
+from models import ROLE_MASKS, RoleEnum
+from revocation import BloomFilter, RevocationList
+from users import InMemoryUserRepository, UserCache
+
+HOUR = 3600
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = [f"jti:{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"jti:other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300  # 约 1% 的设计误判率，留足余量
+
+
+def test_revoked_token_and_user_cutoff(tmp_path):
+    revoked = RevocationList(path=str(tmp_path / "revoked.json"))
+    now = time.time()
+    revoked.revoke_token("jti-1", now + HOUR)
+    revoked.revoke_user("alice", issued_before=now, expires_at=now + HOUR)
+
+    assert revoked.is_revoked("jti-1", "bob", now)
+    assert not revoked.is_revoked("jti-2", "bob", now)
+    assert revoked.is_revoked("jti-2", "alice", now - 1)
+    assert not revoked.is_revoked("jti-2", "alice", now + 1)  # 撤销之后签发的令牌仍然有效
+
+
+def test_bloom_hit_is_confirmed_by_exact_check(tmp_path, monkeypatch):
+    revoked = RevocationList(path=str(tmp_path / "revoked.json"))
+    revoked.revoke_token("jti-1", time.time() + HOUR)
+    # 过滤器误判时，精确集合必须把未撤销的令牌放行
+    monkeypatch.setattr(BloomFilter, "__contains__", lambda self, key: True)
+    assert revoked.is_revoked("jti-1", "bob", 0)
+    assert not revoked.is_revoked("jti-2", "bob", 0)
+    assert not revoked.is_revoked(None, "bob", 0)
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    revoked = RevocationList(path=str(tmp_path / "revoked.json"))
+    revoked.revoke_token("old", time.time() + 0.05)
+    revoked.revoke_token("current", time.time() + HOUR)
+    time.sleep(0.1)
+    revoked._next_sync = 0
+    assert not revoked.is_revoked("old", "bob", 0)
+    assert len(revoked) == 1
+    revoked.revoke_token("another", time.time() + HOUR)
+    with open(tmp_path / "revoked.json", encoding="utf-8") as f:
+        assert set(json.load(f)["tokens"]) == {"current", "another"}
+
+
+def test_revocations_survive_restart(tmp_path):
+    path = str(tmp_path / "revoked.json")
+    RevocationList(path=path).revoke_token("jti-1", time.time() + HOUR)
+    assert RevocationList(path=path).is_revoked("jti-1", "bob", 0)
+
+
+def test_workers_sharing_a_file_keep_each_others_revocations(tmp_path):
+    path = str(tmp_path / "revoked.json")
+    worker_a = RevocationList(path=path)
+    worker_b = RevocationList(path=path)
+    now = time.time()
+    worker_a.revoke_token("jti-a", now + HOUR)
+    worker_b.revoke_token("jti-b", now + HOUR)
+    worker_b.revoke_user("alice", issued_before=now, expires_at=now + HOUR)
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert set(data["tokens"]) == {"jti-a", "jti-b"}
+    assert "alice" in data["users"]
+
+    # worker A 在下一次同步时合并 B 的撤销，同时保留自己的
+    worker_a._next_sync = 0
+    assert worker_a.is_revoked("jti-a", "bob", now)
+    assert worker_a.is_revoked("jti-b", "bob", now)
+    assert worker_a.is_revoked(None, "alice", now - 1)
+    assert RevocationList(path=path).is_revoked("jti-a", "bob", now)
+
+
+@pytest.fixture
+def revocation_list(tmp_path, monkeypatch):
+    revoked = RevocationList(path=str(tmp_path / "revoked.json"))
+    monkeypatch.setattr(auth, "revocation_list", revoked)
+    auth.token_cache.clear()
+    yield revoked
+    auth.token_cache.clear()
+
+
+def test_revoke_token_applies_to_cached_tokens(revocation_list):
+    token = auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    auth.verify_token(token)  # 写入令牌缓存
+    auth.revoke_token(token)
+    with pytest.raises(HTTPException) as error:
+        auth.verify_token(token)
+    assert error.value.status_code == 401
+
+
+def test_revoke_user_tokens_keeps_later_tokens_valid(revocation_list):
+    old_token = auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    auth.verify_token(old_token)
+    auth.revoke_user_tokens("alice")
+    time.sleep(0.01)
+    new_token = auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    with pytest.raises(HTTPException):
+        auth.verify_token(old_token)
+    assert auth.verify_token(new_token).username == "alice"
+
+
+def test_revoke_token_without_exp_is_rejected(revocation_list):
+    token = jwt.encode({"sub": "alice", "jti": "jti-1"}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+    with pytest.raises(HTTPException) as error:
+        auth.revoke_token(token)
+    assert error.value.status_code == 400
+    assert len(revocation_list) == 0
+
+
+def test_token_lifetime_is_capped(revocation_list):
+    token = auth.create_access_token({"sub": "alice"}, timedelta(days=30))
+    payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert payload["exp"] - payload["iat"] <= auth.MAX_TOKEN_LIFETIME.total_seconds() + 1
+
+def test_role_change_revokes_earlier_tokens(revocation_list, monkeypatch):
+    monkeypatch.setattr(auth, "user_cache", UserCache(InMemoryUserRepository(auth.DEMO_USERS)))
+    dropped = ROLE_MASKS[RoleEnum.DEVELOPER] & ~ROLE_MASKS[RoleEnum.END_USER]
+    token = auth.create_access_token({"sub": "developer", "roles": [RoleEnum.DEVELOPER]}, timedelta(minutes=5), compact=True)
+    assert auth.verify_token(token).permission_mask & dropped
+
+    assert asyncio.run(auth.set_user_roles("developer", [RoleEnum.END_USER]))
+    with pytest.raises(HTTPException) as error:
+        auth.verify_token(token)  # 令牌仍携带 DEVELOPER 角色声明，必须被拒绝
+    assert error.value.status_code == 401
+
+    time.sleep(0.01)
+    new_token = auth.create_access_token({"sub": "developer", "roles": [RoleEnum.END_USER]}, timedelta(minutes=5), compact=True)
+    assert not auth.verify_token(new_token).permission_mask & dropped
+    assert asyncio.run(auth.get_current_user(new_token)).roles == [RoleEnum.END_USER]
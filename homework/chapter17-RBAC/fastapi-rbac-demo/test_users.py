@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+from models import RoleEnum
+from users import InMemoryUserRepository, UserCache
+
+ALICE = {
+    "id": 1,
+    "username": "alice",
+    "email": "alice@example.com",
+    "hashed_password": "x",
+    "roles": [RoleEnum.DEVELOPER],
+    "is_active": True,
+    "created_at": datetime.now(),
+}
+
+class SlowRepository(InMemoryUserRepository):
+    """读到数据后等待测试放行才返回，并记录读库次数"""
+
+    def __init__(self, users):
+        super().__init__(users)
+        self.reads = 0
+        self.gate = asyncio.Event()
+
+    async def get_by_username(self, username):
+        self.reads += 1
+        record = dict(await super().get_by_username(username))
+        await self.gate.wait()
+        return record
+
+def test_concurrent_misses_share_one_read():
+    async def check():
+        repository = SlowRepository([ALICE])
+        cache = UserCache(repository)
+        readers = [asyncio.create_task(cache.get("alice")) for _ in range(5)]
+        await asyncio.sleep(0)
+        readers[0].cancel()  # 一个调用方被取消不影响其他调用方
+        repository.gate.set()
+        users = await asyncio.gather(*readers[1:])
+        assert repository.reads == 1
+        assert all(user.username == "alice" for user in users)
+        assert await cache.get("alice") is users[0]
+        assert cache.hits == 1 and not cache._loading
+
+    asyncio.run(check())
+
+def test_read_racing_invalidation_is_not_cached():
+    async def check():
+        repository = SlowRepository([ALICE])
+        cache = UserCache(repository)
+        stale = asyncio.create_task(cache.get("alice"))
+        while not repository.reads:
+            await asyncio.sleep(0)
+        await cache.set_roles("alice", [RoleEnum.END_USER])
+        repository.gate.set()
+        # 读库期间发生了失效：旧数据返回给调用方，但不写回缓存
+        assert (await stale).roles == [RoleEnum.DEVELOPER]
+        assert "alice" not in cache._entries
+        assert (await cache.get("alice")).roles == [RoleEnum.END_USER]
+        assert repository.reads == 2
+        # 每个用户的记录只在读库期间存在
+        cache.invalidate("bob")
+        assert not cache._loading
+
+    asyncio.run(check())
@@ -0,0 +1,282 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from models import RoleEnum, User
+
+# 用户存储。
+#
+# UserRepository 是可插拔的异步接口，这里提供内存和 SQLite 两种实现；
+# SQLite 使用 WAL 模式，多个 uvicorn worker 可以共享同一个数据库文件。
+# UserCache 是 User 对象的读穿透缓存，带 TTL，角色变更时立即失效，
+# 让每个请求的用户查询保持在微秒级。
+
+USER_DB_PATH = "rbac_users.db"
+USER_DB_POOL_SIZE = 4  # SQLite 连接池大小
+USER_CACHE_TTL = 60  # User 对象缓存秒数
+USER_CACHE_SIZE = 10000
+
+T = TypeVar("T")
+
+class UserRepository(ABC):
+    """用户存储接口，返回包含 hashed_password 的用户字典"""
+
+    @abstractmethod
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_by_id(self, user_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def add(self, user: dict) -> dict:
+        """新增用户，id 为空时自动分配"""
+
+    @abstractmethod
+    async def set_roles(self, username: str, roles: List[RoleEnum]) -> bool:
+        """修改用户角色，用户不存在时返回 False"""
+
+    async def close(self) -> None:
+        pass
+
+class InMemoryUserRepository(UserRepository):
+    """内存实现，适合测试和单进程演示"""
+
+    def __init__(self, users: Iterable[dict] = ()):
+        self._by_username: Dict[str, dict] = {}
+        self._by_id: Dict[int, dict] = {}
+        for user in users:
+            self._store(dict(user))
+
+    def _store(self, user: dict) -> None:
+        self._by_username[user["username"]] = user
+        self._by_id[user["id"]] = user
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return self._by_username.get(username)
+
+    async def get_by_id(self, user_id: int) -> Optional[dict]:
+        return self._by_id.get(user_id)
+
+    async def add(self, user: dict) -> dict:
+        if user["username"] in self._by_username:
+            raise ValueError(f"User {user['username']} already exists")
+        user = dict(user)
+        if user.get("id") is None:
+            user["id"] = max(self._by_id, default=0) + 1
+        self._store(user)
+        return user
+
+    async def set_roles(self, username: str, roles: List[RoleEnum]) -> bool:
+        user = self._by_username.get(username)
+        if user is None:
+            return False
+        user["roles"] = list(roles)
+        return True
+
+class SQLiteUserRepository(UserRepository):
+    """SQLite 实现：连接池 + 线程池执行，username 和 id 上都有索引"""
+
+    _COLUMNS = "id, username, email, hashed_password, roles, is_active, created_at"
+
+    def __init__(self, path: str = USER_DB_PATH, pool_size: int = USER_DB_POOL_SIZE, seed_users: Iterable[dict] = ()):
+        self.path = path
+        self.pool_size = pool_size
+        self.seed_users = list(seed_users)  # 建表时写入的初始用户，已存在的用户名跳过
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            if not self._initialized:
+                # id 是 INTEGER PRIMARY KEY（即 rowid），本身就是索引
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY,
+                        username TEXT NOT NULL,
+                        email TEXT NOT NULL,
+                        hashed_password TEXT NOT NULL,
+                        roles TEXT NOT NULL,
+                        is_active INTEGER NOT NULL DEFAULT 1,
+                        created_at TEXT NOT NULL
+                    );
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username);
+                """)
+                with conn:
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO users ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [self._user_to_row(user) for user in self.seed_users],
+                    )
+                self._initialized = True
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._pool.get()
+
+    def _with_connection(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        conn = self._acquire()
+        try:
+            with conn:  # 成功提交，异常回滚
+                return func(conn)
+        finally:
+            self._pool.put(conn)
+
+    async def _run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(None, self._with_connection, func)
+
+    @staticmethod
+    def _row_to_user(row: Optional[Tuple]) -> Optional[dict]:
+        if row is None:
+            return None
+        user_id, username, email, hashed_password, roles, is_active, created_at = row
+        return {
+            "id": user_id,
+            "username": username,
+            "email": email,
+            "hashed_password": hashed_password,
+            "roles": [RoleEnum(role) for role in roles.split(",") if role],
+            "is_active": bool(is_active),
+            "created_at": datetime.fromisoformat(created_at),
+        }
+
+    @staticmethod
+    def _user_to_row(user: dict) -> Tuple:
+        return (
+            user.get("id"),
+            user["username"],
+            user["email"],
+            user["hashed_password"],
+            ",".join(RoleEnum(role).value for role in user.get("roles", [])),
+            int(user.get("is_active", True)),
+            (user.get("created_at") or datetime.now()).isoformat(),
+        )
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        sql = f"SELECT {self._COLUMNS} FROM users WHERE username = ?"
+        return self._row_to_user(await self._run(lambda conn: conn.execute(sql, (username,)).fetchone()))
+
+    async def get_by_id(self, user_id: int) -> Optional[dict]:
+        sql = f"SELECT {self._COLUMNS} FROM users WHERE id = ?"
+        return self._row_to_user(await self._run(lambda conn: conn.execute(sql, (user_id,)).fetchone()))
+
+    async def add(self, user: dict) -> dict:
+        row = self._user_to_row(user)
+
+        def insert(conn: sqlite3.Connection) -> int:
+            try:
+                return conn.execute(f"INSERT INTO users ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+            except sqlite3.IntegrityError:
+                raise ValueError(f"User {user['username']} already exists")
+
+        user_id = await self._run(insert)
+        return {**user, "id": user_id}
+
+    async def set_roles(self, username: str, roles: List[RoleEnum]) -> bool:
+        value = ",".join(RoleEnum(role).value for role in roles)
+        sql = "UPDATE users SET roles = ? WHERE username = ?"
+        return await self._run(lambda conn: conn.execute(sql, (value, username)).rowcount) > 0
+
+    async def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+class UserCache:
+    """
+    User 对象的读穿透缓存，条目在 TTL 后过期，角色变更时立即失效。
+
+    同一用户的并发未命中只读一次库；缓存在每个进程内，多 worker 部署时其他 worker 最迟在 TTL 后看到变更。
+    """
+
+    def __init__(self, repository: UserRepository, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.repository = repository
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Tuple[float, User]] = {}
+        # 正在读库的用户；读库期间发生失效时条目被移除，读到的旧数据不写回缓存
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._listeners: List[Callable[[str], None]] = []
+
+    def on_invalidate(self, listener: Callable[[str], None]) -> None:
+        """注册用户失效回调（如清理该用户的令牌缓存）"""
+        self._listeners.append(listener)
+
+    async def get(self, username: str) -> Optional[User]:
+        entry = self._entries.get(username)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        task = self._loading.get(username)
+        if task is None:
+            task = asyncio.ensure_future(self._load(username))
+            self._loading[username] = task
+            task.add_done_callback(lambda t: self._load_done(username, t))
+        # 某个调用方被取消不影响其他等待同一次读库的调用方
+        return await asyncio.shield(task)
+
+    async def _load(self, username: str) -> Optional[User]:
+        record = await self.repository.get_by_username(username)
+        current = self._loading.get(username) is asyncio.current_task()
+        if record is None:
+            if current:
+                self._entries.pop(username, None)
+            return None
+        user = User(**record)
+        if not current:
+            return user
+        self._entries.pop(username, None)
+        if len(self._entries) >= self.max_size:
+            # 超出上限时丢弃最早写入的条目
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[username] = (time.monotonic() + self.ttl, user)
+        return user
+
+    def _load_done(self, username: str, task: asyncio.Task) -> None:
+        if self._loading.get(username) is task:
+            del self._loading[username]
+        if not task.cancelled():
+            task.exception()  # 调用方都已取消时也不报告“异常未被获取”
+
+    def invalidate(self, username: str) -> None:
+        self._loading.pop(username, None)
+        self._entries.pop(username, None)
+        for listener in self._listeners:
+            listener(username)
+
+    async def set_roles(self, username: str, roles: List[RoleEnum]) -> bool:
+        """修改角色并使缓存失效"""
+        updated = await self.repository.set_roles(username, roles)
+        self.invalidate(username)
+        return updated